@@ -1,42 +1,61 @@
-from flask import Flask, jsonify
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock, Thread
+import json
+import os
+import time
+
+from flask import Flask, Response, jsonify, request
 import requests
 
 app = Flask(__name__)
 
-PROMETHEUS_URL = "http://prometheus-server.default.svc.cluster.local/api/v1/query"
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://prometheus-server.default.svc.cluster.local/api/v1/query")
+PROMETHEUS_TIMEOUT = float(os.getenv("PROMETHEUS_TIMEOUT", "2"))
+USE_SCORE_TTL = float(os.getenv("USE_SCORE_TTL", "5"))              # seconds a sample is fresh
+USE_SCORE_MAX_STALE = float(os.getenv("USE_SCORE_MAX_STALE", "60"))  # seconds a stale sample may be served
+BACKGROUND_REFRESH = os.getenv("BACKGROUND_REFRESH", "1") == "1"
+STREAM_THRESHOLD = float(os.getenv("STREAM_THRESHOLD", "1.0"))  # min use_score change to publish
+STREAM_HISTORY = int(os.getenv("STREAM_HISTORY", "256"))        # deltas kept for reconnecting clients
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+LONG_POLL_TIMEOUT = float(os.getenv("LONG_POLL_TIMEOUT", "30"))
 
 CPU_QUERY = '100 - (avg by(instance) (irate(node_cpu_seconds_total{mode="idle"}[5m])) * 100)'
 MEM_QUERY = '100 - (avg by(instance) (node_memory_MemAvailable_bytes) * 100 / avg by(instance) (node_memory_MemTotal_bytes))'
 CPU_SATURATION_QUERY = 'avg by(instance) (irate(node_cpu_seconds_total{mode="iowait"}[5m])) * 100'
 ERRORS_QUERY = 'sum by(instance) (rate(node_disk_io_errors_total[5m]))'
+QUERIES = (CPU_QUERY, MEM_QUERY, CPU_SATURATION_QUERY, ERRORS_QUERY)
+
+# One pooled keep-alive connection per concurrent query
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(QUERIES))
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+query_pool = ThreadPoolExecutor(max_workers=len(QUERIES))
 
 def query_prometheus(query):
     try:
-        response = requests.get(PROMETHEUS_URL, params={"query": query})
+        response = session.get(PROMETHEUS_URL, params={"query": query}, timeout=PROMETHEUS_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         if data["status"] != "success":
-            return []
+            return None
         return data["data"]["result"]
     except Exception as e:
         print(f"Error querying Prometheus ({query}):", e)
-        return []
+        return None
 
-@app.route('/use_score', methods=['GET'])
-def get_use_score():
-    cpu_results = query_prometheus(CPU_QUERY)
-    mem_results = query_prometheus(MEM_QUERY)
-    sat_results = query_prometheus(CPU_SATURATION_QUERY)
-    err_results = query_prometheus(ERRORS_QUERY)
+def to_map(results):
+    return {item["metric"].get("instance", "unknown"): float(item["value"][1]) for item in results or []}
 
-    cpu_map = {item["metric"].get("instance", "unknown"): float(item["value"][1]) for item in cpu_results}
-    mem_map = {item["metric"].get("instance", "unknown"): float(item["value"][1]) for item in mem_results}
-    sat_map = {item["metric"].get("instance", "unknown"): float(item["value"][1]) for item in sat_results}
-    err_map = {item["metric"].get("instance", "unknown"): float(item["value"][1]) for item in err_results}
+def compute_use_scores():
+    """Run the four queries concurrently; returns (scores, complete)."""
+    results = list(query_pool.map(query_prometheus, QUERIES))
+    cpu_map, mem_map, sat_map, err_map = (to_map(r) for r in results)
 
     instances = set(cpu_map) | set(mem_map) | set(sat_map) | set(err_map)
 
-    results = {}
+    scores = {}
     for instance in instances:
         cpu = cpu_map.get(instance, 0.0)
         mem = mem_map.get(instance, 0.0)
@@ -45,7 +64,7 @@ def get_use_score():
 
         use_score = cpu + sat + err
 
-        results[instance] = {
+        scores[instance] = {
             "cpu_utilization_percent": round(cpu, 2),
             "memory_utilization_percent": round(mem, 2),
             "cpu_saturation_iowait_percent": round(sat, 2),
@@ -53,8 +72,168 @@ def get_use_score():
             "use_score": round(use_score, 2)
         }
 
-    return jsonify(results)
+    return scores, all(r is not None for r in results)
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000)
+class UseScoreCache:
+    """Last USE score sample, served stale-while-revalidate.
+
+    A fresh sample (younger than ``ttl``) is returned as is. A stale one is
+    still returned immediately while a single refresh runs in the background.
+    Only when there is no sample at all, or it is older than ``max_stale``,
+    does a reader wait for Prometheus. A refresh where any query failed does
+    not replace a previous complete sample.
+    """
+
+    def __init__(self, ttl, max_stale):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.value = None
+        self.complete = False
+        self.fetched_at = 0.0
+        self.refresh_lock = Lock()
+        self.refreshing = False
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def refresh(self, if_older_than=0.0):
+        with self.refresh_lock:
+            # Concurrent readers queue on the lock; the first one does the work
+            if self.value is not None and self.age() < if_older_than:
+                return
+            scores, complete = compute_use_scores()
+            if complete or not self.complete or self.age() > self.max_stale:
+                self.value = scores
+                self.complete = complete
+                self.fetched_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        finally:
+            self.refreshing = False
+
+    def get(self):
+        if self.value is None or self.age() > self.max_stale:
+            self.refresh(if_older_than=self.max_stale)
+        elif self.age() > self.ttl and not self.refreshing:
+            self.refreshing = True
+            Thread(target=self._refresh_in_background, daemon=True).start()
+        return self.value
+
+    def run(self, on_sample=None):
+        """Keep the sample fresh so readers never hit Prometheus."""
+        while True:
+            started = time.monotonic()
+            self.refresh()
+            if on_sample is not None and self.value is not None:
+                on_sample(self.value)
+            time.sleep(max(0.0, self.ttl / 2 - (time.monotonic() - started)))
+
+class ScoreFeed:
+    """Versioned per-instance USE scores, published only when they move.
+
+    ``publish()`` is fed by the single background sampler. An instance is
+    included in a delta when it appears, disappears, or its use_score moved
+    by at least ``threshold`` since the value last published for it. Each
+    delta bumps ``version``; the last ``history`` deltas are kept so a client
+    that reconnects with its last version only receives what it missed.
+    """
 
+    def __init__(self, threshold, history):
+        self.threshold = threshold
+        self.snapshot = {}
+        self.version = 0
+        self.deltas = deque(maxlen=history)  # (version, {instance: scores or None})
+        self.cond = Condition()
+
+    def publish(self, scores):
+        with self.cond:
+            delta = {}
+            for instance, values in scores.items():
+                previous = self.snapshot.get(instance)
+                if previous is None or abs(values["use_score"] - previous["use_score"]) >= self.threshold:
+                    delta[instance] = values
+            for instance in self.snapshot.keys() - scores.keys():
+                delta[instance] = None
+            if not delta:
+                return
+            for instance, values in delta.items():
+                if values is None:
+                    del self.snapshot[instance]
+                else:
+                    self.snapshot[instance] = values
+            self.version += 1
+            self.deltas.append((self.version, delta))
+            self.cond.notify_all()
+
+    def changes_since(self, version):
+        """Return (version, changes, full); ``full`` means changes is a whole snapshot."""
+        with self.cond:
+            if version == self.version:
+                return self.version, {}, False
+            if self.deltas and 0 < version and version >= self.deltas[0][0] - 1 and version < self.version:
+                changes = {}
+                for v, delta in self.deltas:
+                    if v > version:
+                        changes.update(delta)
+                return self.version, changes, False
+            return self.version, dict(self.snapshot), True
+
+    def wait(self, version, timeout):
+        """Block until there is something newer than ``version`` or ``timeout`` expires."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.version != version, timeout)
+        return self.changes_since(version)
+
+use_scores = UseScoreCache(USE_SCORE_TTL, USE_SCORE_MAX_STALE)
+score_feed = ScoreFeed(STREAM_THRESHOLD, STREAM_HISTORY)
+sampler_lock = Lock()
+sampler = None
+
+def ensure_sampler():
+    global sampler
+    with sampler_lock:
+        if sampler is None:
+            sampler = Thread(target=use_scores.run, args=(score_feed.publish,), daemon=True)
+            sampler.start()
+
+@app.route('/use_score', methods=['GET'])
+def get_use_score():
+    response = jsonify(use_scores.get())
+    response.headers["X-Use-Score-Age"] = f"{use_scores.age():.3f}"
+    return response
+
+@app.route('/use_score/poll', methods=['GET'])
+def poll_use_score():
+    """Long-poll: returns changes after ``version``, waiting up to ``timeout`` seconds for some."""
+    ensure_sampler()
+    version = request.args.get('version', default=0, type=int)
+    timeout = min(request.args.get('timeout', default=LONG_POLL_TIMEOUT, type=float), LONG_POLL_TIMEOUT)
+    version, changes, full = score_feed.wait(version, timeout)
+    return jsonify({"version": version, "full": full, "changes": changes})
+
+@app.route('/use_score/stream', methods=['GET'])
+def stream_use_score():
+    """Server-Sent Events: a ``snapshot`` event, then a ``delta`` event per change."""
+    ensure_sampler()
+    last_id = request.headers.get('Last-Event-ID', type=int) or 0
+
+    def events(version):
+        yield "retry: 3000\n\n"
+        while True:
+            new_version, changes, full = score_feed.wait(version, STREAM_HEARTBEAT)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            kind = "snapshot" if full else "delta"
+            yield f"id: {version}\nevent: {kind}\ndata: {json.dumps(changes)}\n\n"
+
+    return Response(events(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+if __name__ == '__main__':
+    if BACKGROUND_REFRESH:
+        ensure_sampler()
+    app.run(host='0.0.0.0', port=int(os.getenv("HTTP_PORT", "5000")))
@@ -0,0 +1,153 @@
+"""Compare the controller's threaded and asyncio HTTP front ends.
+
+Each server mode is started in a child process with the RabbitMQ exchange
+replaced by an in-memory stand-in that sleeps for a configurable publish
+delay, then a closed-loop aiohttp client fires GET /high and /low requests
+at a fixed concurrency and reports requests/sec and latency percentiles.
+The child runs with tracing disabled and without the threaded server's
+per-request access log, as the asyncio server has none, and its output goes
+to a log file (``--log-dir``) instead of the terminal.
+
+    python benchmarks/bench_controller_server.py --requests 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "controller")
+TRACING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tracing")
+
+
+class FakeExchange:
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def publish(self, message, routing_key):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+
+async def serve(mode, port, channels, delay):
+    os.environ["NUM_CHANNEL"] = str(channels)
+    sys.path.insert(0, CONTROLLER_DIR)
+    sys.path.insert(0, TRACING_DIR)
+    import controller
+
+    # Neither server should pay for a stderr line per request
+    controller.ControllerHandler.log_message = lambda self, *args: None
+    controller.PORT = port
+    controller.loop = asyncio.get_running_loop()
+    controller.exchange = FakeExchange(delay)
+    controller.start_publisher(controller.exchange)
+    await controller.serve_http(mode)
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.05)
+    raise RuntimeError(f"Server on port {port} did not come up")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run_load(port, total, concurrency):
+    latencies = []
+    errors = 0
+    next_request = 0
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def worker():
+            nonlocal next_request, errors
+            while next_request < total:
+                i = next_request
+                next_request += 1
+                level = "high" if i % 2 == 0 else "low"
+                start = time.perf_counter()
+                try:
+                    async with session.get(f"http://127.0.0.1:{port}/{level}") as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1],
+        "errors": errors,
+    }
+
+
+def bench_mode(args, mode, port):
+    log_path = os.path.join(args.log_dir, f"controller_{mode}.log")
+    with open(log_path, "w") as log:
+        child = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), "--serve", mode,
+            "--port", str(port), "--channels", str(args.channels),
+            "--publish-delay", str(args.publish_delay),
+        ], env={**os.environ, "TRACING_ENABLED": "0"}, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        try:
+            wait_for_port(port)
+        except RuntimeError as e:
+            raise RuntimeError(f"{e}, see {log_path}") from None
+        asyncio.run(run_load(port, min(args.requests // 10, 500), args.concurrency))  # warm-up
+        return asyncio.run(run_load(port, args.requests, args.concurrency))
+    finally:
+        child.terminate()
+        child.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--channels", type=int, default=3)
+    parser.add_argument("--publish-delay", type=float, default=0.0005,
+                        help="simulated broker round trip per publish, in seconds")
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--modes", default="threaded,asyncio")
+    parser.add_argument("--log-dir", help="where the controllers' output goes, defaults to a temporary directory")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args.serve, args.port, args.channels, args.publish_delay))
+        return
+
+    args.log_dir = args.log_dir or tempfile.mkdtemp(prefix="bench_controller_server_")
+    os.makedirs(args.log_dir, exist_ok=True)
+    print(f"{'mode':<10} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9} {'errors':>7}")
+    for i, mode in enumerate(args.modes.split(",")):
+        r = bench_mode(args, mode, args.port + i)
+        print(f"{mode:<10} {r['rps']:>10.0f} {r['p50'] * 1000:>9.2f} "
+              f"{r['p99'] * 1000:>9.2f} {r['max'] * 1000:>9.2f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Fixed vs adaptive dispatcher concurrency against a backend whose capacity changes.
+
+Poisson messages queue up "in the broker" and are taken by a consumer that
+handles at most ``concurrency`` at once, as the dispatcher's QueueConsumer
+does. Each message calls an in-process stub backend standing in for a
+Knative function: ``capacity`` requests are served at once with exponential
+service times, up to ``--backend-queue`` more wait inside it, and beyond
+that it answers 503, after which the message is retried once
+``--retry-backoff`` has passed, still holding its slot as the executor
+client's retries do. The capacity changes per phase (``--capacity 8,3,8``),
+like a node getting loaded by other tenants and freed again.
+
+``fixed:N`` keeps the concurrency at N; ``aimd`` and ``gradient`` use the
+dispatcher's adaptive limits (``dispatcher/limiter.py``) starting from
+``--initial``. Reported per phase: completions per second, executor call
+latency, latency from arrival, 503s and the average limit.
+
+    python benchmarks/bench_limiter.py --modes fixed:5,fixed:50,aimd,gradient --phase 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dispatcher"))
+
+from limiter import make_limit  # noqa: E402
+
+
+class StubBackend:
+    def __init__(self, capacity, queue_max, service_time, rng):
+        self.capacity = capacity
+        self.queue_max = queue_max
+        self.service_time = service_time
+        self.rng = rng
+        self.busy = 0
+        self.waiting = deque()
+
+    async def call(self):
+        if self.busy >= self.capacity:
+            if len(self.waiting) >= self.queue_max:
+                return 503
+            future = asyncio.get_running_loop().create_future()
+            self.waiting.append(future)
+            await future
+        else:
+            self.busy += 1
+        try:
+            await asyncio.sleep(self.rng.expovariate(1 / self.service_time))
+        finally:
+            self.busy -= 1
+            self.wake()
+        return 200
+
+    def wake(self):
+        while self.waiting and self.busy < self.capacity:
+            self.busy += 1
+            self.waiting.popleft().set_result(None)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run_mode(mode, args):
+    rng = random.Random(args.seed)
+    capacities = [int(c) for c in args.capacity.split(",")]
+    backend = StubBackend(capacities[0], args.backend_queue, args.service_time, random.Random(args.seed + 1))
+    consumer = {"concurrency": args.initial}
+
+    def resize(limit_value):
+        consumer["concurrency"] = limit_value
+        freed.set()
+
+    limit = None
+    if mode.startswith("fixed:"):
+        consumer["concurrency"] = int(mode.split(":", 1)[1])
+    else:
+        options = {"timeout": args.aimd_timeout} if mode == "aimd" else {}
+        limit = make_limit(mode, args.initial, 1, args.max_limit, on_change=resize, **options)
+
+    broker = deque()
+    arrived = asyncio.Event()
+    freed = asyncio.Event()
+    tasks = set()
+    start = time.monotonic()
+    end = start + args.phase * len(capacities)
+    phases = [{"done": 0, "calls": [], "total": [], "drops": 0, "limit": []} for _ in capacities]
+
+    def phase_at(t):
+        return min(int((t - start) / args.phase), len(capacities) - 1)
+
+    async def handle(arrival):
+        called = time.monotonic()
+        if limit is not None:
+            with limit.measure() as sample:
+                status = await backend.call()
+                sample.dropped = status >= 500
+        else:
+            status = await backend.call()
+        now = time.monotonic()
+        stats = phases[phase_at(now)]
+        if status >= 500:
+            stats["drops"] += 1
+            await asyncio.sleep(args.retry_backoff)
+            broker.appendleft(arrival)
+            arrived.set()
+            return
+        stats["done"] += 1
+        stats["calls"].append(now - called)
+        stats["total"].append(now - arrival)
+
+    async def produce():
+        while True:
+            await asyncio.sleep(rng.expovariate(args.rate))
+            now = time.monotonic()
+            if now >= end:
+                return
+            broker.append(now)
+            arrived.set()
+
+    async def consume():
+        while True:
+            while not broker:
+                arrived.clear()
+                await arrived.wait()
+            while len(tasks) >= consumer["concurrency"]:
+                freed.clear()
+                await freed.wait()
+            task = asyncio.create_task(handle(broker.popleft()))
+            tasks.add(task)
+            task.add_done_callback(lambda t: (tasks.discard(t), freed.set()))
+
+    async def change_capacity():
+        for capacity in capacities[1:]:
+            await asyncio.sleep(args.phase)
+            backend.capacity = capacity
+            backend.wake()
+
+    async def sample_limit():
+        while True:
+            await asyncio.sleep(0.1)
+            phases[phase_at(time.monotonic())]["limit"].append(consumer["concurrency"])
+
+    helpers = [asyncio.create_task(coro) for coro in (consume(), change_capacity(), sample_limit())]
+    await produce()
+    for task in helpers + list(tasks):
+        task.cancel()
+    await asyncio.gather(*helpers, *tasks, return_exceptions=True)
+    return capacities, phases, len(broker)
+
+
+async def main_async(args):
+    print(f"offered {args.rate:.0f} msg/s, backend capacity per phase "
+          + ", ".join(f"{int(c) / args.service_time:.0f}/s" for c in args.capacity.split(",")))
+    print(f"{'mode':<10} {'phase':>5} {'done/s':>7} {'call p50':>9} {'call p99':>9} "
+          f"{'total p99':>10} {'503s':>6} {'limit':>6}")
+    for mode in args.modes.split(","):
+        capacities, phases, backlog = await run_mode(mode, args)
+        for i, (capacity, stats) in enumerate(zip(capacities, phases)):
+            calls, total = sorted(stats["calls"]), sorted(stats["total"])
+            avg_limit = sum(stats["limit"]) / len(stats["limit"]) if stats["limit"] else 0.0
+            print(f"{mode:<10} {i:>5} {stats['done'] / args.phase:>7.1f} "
+                  f"{percentile(calls, 50) * 1000:>7.0f}ms {percentile(calls, 99) * 1000:>7.0f}ms "
+                  f"{percentile(total, 99) * 1000:>8.0f}ms {stats['drops']:>6} {avg_limit:>6.1f}")
+        print(f"{mode:<10} left in the broker: {backlog}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default="fixed:5,fixed:50,aimd,gradient")
+    parser.add_argument("--rate", type=float, default=60.0, help="offered messages per second")
+    parser.add_argument("--capacity", default="8,3,8", help="backend concurrency per phase")
+    parser.add_argument("--phase", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--service-time", type=float, default=0.1, help="mean backend service time in seconds")
+    parser.add_argument("--backend-queue", type=int, default=20, help="requests waiting in the backend before 503")
+    parser.add_argument("--retry-backoff", type=float, default=0.05, help="seconds before retrying a 503")
+    parser.add_argument("--aimd-timeout", type=float, default=5.0, help="LIMIT_AIMD_TIMEOUT")
+    parser.add_argument("--initial", type=int, default=5, help="starting limit of the adaptive modes")
+    parser.add_argument("--max-limit", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
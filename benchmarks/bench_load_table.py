@@ -0,0 +1,73 @@
+"""Micro-benchmark of least-loaded channel selection vs. channel count.
+
+Times one pick + matching decrement on the controller's LoadTable against
+the original linear ``min()`` scan over a dict guarded by a single lock, for
+a range of channel counts, with the table pre-loaded with random counts.
+
+    python benchmarks/bench_load_table.py --channels 3,10,30,100,300,1000
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+from threading import Lock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "controller"))
+
+from load_table import LoadTable  # noqa: E402
+
+LEVELS = ("high", "low")
+
+
+class LinearScan:
+    def __init__(self, channels):
+        self.channels = channels
+        self.counts = {ch: {level: 0 for level in LEVELS} for ch in channels}
+        self.lock = Lock()
+
+    def pick(self, level):
+        with self.lock:
+            channel = min(self.channels, key=lambda ch: self.counts[ch][level])
+            self.counts[channel][level] += 1
+        return channel
+
+    def decrement(self, channel, level):
+        with self.lock:
+            if self.counts[channel][level] > 0:
+                self.counts[channel][level] -= 1
+
+
+def preload(table, channels, rng):
+    for _ in range(len(channels) * 20):
+        table.pick(rng.choice(LEVELS))
+    for _ in range(len(channels) * 10):
+        table.decrement(rng.choice(channels), rng.choice(LEVELS))
+
+
+def time_cycle(table, number):
+    def cycle():
+        table.decrement(table.pick("high"), "high")
+
+    best = min(timeit.repeat(cycle, number=number, repeat=5))
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", default="3,10,30,100,300,1000")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'channels':>8} {'linear us':>10} {'heap us':>10} {'speedup':>8}")
+    for n in (int(c) for c in args.channels.split(",")):
+        channels = [f"channel{i}" for i in range(n)]
+        results = []
+        for table in (LinearScan(channels), LoadTable(channels, LEVELS)):
+            preload(table, channels, random.Random(n))
+            results.append(time_cycle(table, args.number))
+        print(f"{n:>8} {results[0]:>10.2f} {results[1]:>10.2f} {results[0] / results[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Per-priority latency of the dispatcher's scheduler policies under overload.
+
+Starts a stub executor (an aiohttp server standing in for the Knative
+functions, serving at most ``--capacity`` requests at once with exponential
+service times), then offers Poisson high and low traffic above that
+capacity. Each message is held locally like a prefetched RabbitMQ delivery
+(bounded per level by ``--prefetch``), waits for a PriorityScheduler slot,
+and calls the stub over HTTP. Latency is measured from arrival, so time
+spent "in the broker" counts too.
+
+    python benchmarks/bench_scheduler.py --duration 20 --high-rate 60 --low-rate 30
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dispatcher"))
+
+from scheduler import LEVELS, SCHEDULER_POLICIES, PriorityScheduler  # noqa: E402
+
+
+async def start_stub_executor(port, capacity, service_time, seed):
+    rng = random.Random(seed)
+    busy = asyncio.Semaphore(capacity)
+
+    async def handle(request):
+        async with busy:
+            await asyncio.sleep(rng.expovariate(1 / service_time))
+        return web.Response(text="Hello, world!\n")
+
+    app = web.Application()
+    app.router.add_get("/", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def run_policy(policy, args):
+    scheduler = PriorityScheduler(args.limit, policy)
+    prefetch = {level: asyncio.Semaphore(args.prefetch) for level in LEVELS}
+    latencies = {level: [] for level in LEVELS}
+    offered = {level: 0 for level in LEVELS}
+    url = f"http://127.0.0.1:{args.port}/"
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        async def handle(level, arrived):
+            async with prefetch[level]:
+                async with scheduler.slot(level):
+                    async with session.get(url, headers={"Host": f"{level}priorityfunc"}) as resp:
+                        await resp.read()
+            latencies[level].append(time.monotonic() - arrived)
+
+        async def produce(level, rate, rng):
+            tasks = []
+            end = time.monotonic() + args.duration
+            while True:
+                await asyncio.sleep(rng.expovariate(rate))
+                if time.monotonic() >= end:
+                    return tasks
+                offered[level] += 1
+                tasks.append(asyncio.create_task(handle(level, time.monotonic())))
+
+        rates = {"high": args.high_rate, "low": args.low_rate}
+        producers = [produce(level, rates[level], random.Random(args.seed + i)) for i, level in enumerate(LEVELS)]
+        tasks = [t for batch in await asyncio.gather(*producers) for t in batch]
+
+        # Messages still queued at the end of the run are what overload left behind
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {level: (offered[level], sorted(latencies[level])) for level in LEVELS}
+
+
+async def main_async(args):
+    runner = await start_stub_executor(args.port, args.capacity, args.service_time, args.seed)
+    try:
+        capacity_rps = args.capacity / args.service_time
+        print(f"stub capacity ~{capacity_rps:.0f} req/s, offered {args.high_rate + args.low_rate:.0f} req/s")
+        print(f"{'policy':<9} {'level':<5} {'offered':>8} {'done':>6} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for policy in args.policies.split(","):
+            for level, (offered, values) in (await run_policy(policy, args)).items():
+                print(f"{policy:<9} {level:<5} {offered:>8} {len(values):>6} "
+                      f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 99) * 1000:>9.1f} "
+                      f"{(values[-1] if values else 0) * 1000:>9.1f}")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--policies", default=",".join(SCHEDULER_POLICIES))
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--high-rate", type=float, default=60.0)
+    parser.add_argument("--low-rate", type=float, default=30.0)
+    parser.add_argument("--capacity", type=int, default=6, help="concurrent requests the stub executor serves")
+    parser.add_argument("--service-time", type=float, default=0.08, help="mean stub service time in seconds")
+    parser.add_argument("--limit", type=int, default=6, help="scheduler EXECUTOR_CONCURRENCY")
+    parser.add_argument("--prefetch", type=int, default=50, help="messages held locally per level")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
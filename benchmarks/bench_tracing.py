@@ -0,0 +1,137 @@
+"""Per-message cost of the dispatcher's tracing under each tracing_setup mode.
+
+Runs the dispatcher's per-message tracing from ``dispatcher/message_tracing.py``
+as process_message does (attach the parent from the message headers, the
+message span, inject into the executor call headers, the nested FaaS span)
+with the Jaeger exporter replaced by one that discards spans, and reports
+microseconds per message against the same loop with no tracing at all. Incoming messages carry a parent
+sampled with the mode's ratio, as the controller would send them, and
+``--fail-rate`` of them get an HTTP 503 from the "executor" so tail
+retention has something to keep.
+
+Each mode runs in its own process since a tracer provider
+can only be installed once.
+
+    python benchmarks/bench_tracing.py --messages 50000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+TRACING_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tracing")
+DISPATCHER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dispatcher")
+
+# name -> (env for tracing_setup, fresh propagator per message like before tracing_setup)
+MODES = {
+    "baseline": (None, False),
+    "legacy": ({"TRACE_SAMPLE_RATIO": "1.0"}, True),
+    "always_on": ({"TRACE_SAMPLE_RATIO": "1.0"}, False),
+    "ratio_0.01": ({"TRACE_SAMPLE_RATIO": "0.01"}, False),
+    "ratio_0.01_tail": ({"TRACE_SAMPLE_RATIO": "0.01", "TRACE_TAIL_LATENCY_MS": "1000"}, False),
+    "disabled": ({"TRACING_ENABLED": "0"}, False),
+}
+
+
+def parent_headers(rng, ratio):
+    flags = "01" if rng.random() < ratio else "00"
+    return {"traceparent": f"00-{rng.getrandbits(128):032x}-{rng.getrandbits(64):016x}-{flags}", "send_ts": "0"}
+
+
+def run_mode(name, messages, fail_rate, seed):
+    env, fresh_propagator = MODES[name]
+    rng = random.Random(seed)
+    ratio = float((env or {}).get("TRACE_SAMPLE_RATIO", "1.0"))
+    incoming = [parent_headers(rng, ratio) for _ in range(messages)]
+    failed = [rng.random() < fail_rate for _ in range(messages)]
+    queue_name = "channel0.high"
+    body = b"request"
+
+    if env is None:
+        start = time.perf_counter()
+        for headers, fail in zip(incoming, failed):
+            http_headers = {"Host": "highpriorityfunc.default.127.0.0.1.sslip.io"}
+            http_headers.update(headers)
+            status = 503 if fail else 200
+        elapsed = time.perf_counter() - start
+        return {"us_per_message": elapsed / messages * 1e6, "exported_per_message": 0.0}
+
+    os.environ.update(env)
+    sys.path[:0] = [TRACING_DIR, DISPATCHER_DIR]
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+    import tracing_setup
+    import message_tracing
+
+    class CountingExporter(SpanExporter):
+        exported = 0
+
+        def export(self, spans):
+            CountingExporter.exported += len(spans)
+            return SpanExportResult.SUCCESS
+
+    tracer = tracing_setup.setup_tracing("bench", exporter=CountingExporter())
+
+    if fresh_propagator:
+        class FreshPropagator:
+            def extract(self, carrier):
+                return TraceContextTextMapPropagator().extract(carrier)
+
+            def inject(self, carrier):
+                TraceContextTextMapPropagator().inject(carrier)
+
+        tracing_setup.propagator = FreshPropagator()
+
+    start = time.perf_counter()
+    for headers, fail in zip(incoming, failed):
+        token = message_tracing.attach_context(headers)
+        try:
+            with message_tracing.message_span(tracer, queue_name, len(body)):
+                http_headers = message_tracing.trace_headers()
+                http_headers["Host"] = "highpriorityfunc.default.127.0.0.1.sslip.io"
+                with message_tracing.faas_span(tracer, "high") as faas_span:
+                    faas_span.set_attribute("http.status_code", 503 if fail else 200)
+        finally:
+            message_tracing.detach_context(token)
+    elapsed = time.perf_counter() - start
+
+    from opentelemetry import trace
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "force_flush"):
+        provider.force_flush()
+    return {"us_per_message": elapsed / messages * 1e6, "exported_per_message": CountingExporter.exported / messages}
+
+
+def main(args):
+    results = {}
+    for name in args.modes.split(","):
+        out = subprocess.run(
+            [sys.executable, __file__, "--run", name, "--messages", str(args.messages),
+             "--fail-rate", str(args.fail_rate), "--seed", str(args.seed)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[name] = json.loads(out.strip().splitlines()[-1])
+
+    base = results.get("baseline", {}).get("us_per_message", 0.0)
+    print(f"{args.messages} messages per mode, {args.fail_rate:.1%} failing")
+    print(f"{'mode':>16} {'us/msg':>9} {'overhead':>9} {'spans exported/msg':>19}")
+    for name, r in results.items():
+        print(f"{name:>16} {r['us_per_message']:>9.2f} {r['us_per_message'] - base:>9.2f} "
+              f"{r['exported_per_message']:>19.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--fail-rate", type=float, default=0.01)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.messages, args.fail_rate, args.seed)))
+    else:
+        main(args)
@@ -0,0 +1,485 @@
+"""In-memory stand-in for RabbitMQ and the slice of aio_pika the services use.
+
+``FakeBroker`` is an asyncio TCP server holding exchanges and queues in
+memory. Clients speak newline-delimited JSON to it rather than AMQP, so the
+services are pointed at it by swapping ``aio_pika`` for this module:
+
+    python benchmarks/fake_amqp.py run controller/controller.py
+
+runs the script as ``__main__`` with ``import aio_pika`` resolving here. The
+broker address is taken from the URL or host/port the service passes to
+``connect_robust``, i.e. from its usual RABBITMQ_* settings.
+
+Supported: direct and fanout exchanges plus the default exchange, durable
+or server-named queues, bindings, passive declares with message counts,
+per-channel prefetch with round-robin delivery to consumers, acks and
+rejects (unacked messages are requeued when a connection drops), per-message
+expiration with the queue's ``x-dead-letter-exchange`` (expired messages at
+the head of a queue, and messages rejected without requeue, are moved there
+with their routing key and an ``x-death`` header), and publisher
+confirms (a publish resolves once the broker holds the message).
+"""
+import asyncio
+import base64
+import enum
+import itertools
+import json
+import os
+import runpy
+import sys
+import time
+from collections import deque
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+
+# Broker
+
+class _Queue:
+    def __init__(self, name, exclusive_to=None, arguments=None):
+        self.name = name
+        self.dead_letter_exchange = (arguments or {}).get("x-dead-letter-exchange")
+        self.messages = deque()
+        self.consumers = []  # (session, channel id, consumer tag)
+        self.next_consumer = 0
+        self.exclusive_to = exclusive_to
+
+
+class _Session:
+    """One client connection to the broker."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.prefetch = {}  # channel id -> prefetch count, 0 = unlimited
+        self.unacked = {}   # channel id -> {delivery tag: (queue name, message)}
+        self.delivery_tags = itertools.count(1)
+
+    def send(self, payload):
+        self.writer.write(json.dumps(payload).encode() + b"\n")
+
+    def has_capacity(self, channel):
+        prefetch = self.prefetch.get(channel, 0)
+        return not prefetch or len(self.unacked.get(channel, ())) < prefetch
+
+
+class FakeBroker:
+    def __init__(self):
+        self.exchanges = {"": "direct"}
+        self.bindings = {}  # exchange -> set of (queue name, routing key)
+        self.queues = {}
+        self.names = itertools.count(1)
+        self.server = None
+        self.sweeper = None
+
+        # Counters
+        self.published = 0
+        self.delivered = 0
+        self.acked = 0
+        self.expired = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self.serve, host, port, limit=2 ** 24)
+        self.sweeper = asyncio.create_task(self.sweep())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.sweeper.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def route(self, exchange, routing_key):
+        if exchange == "":
+            return [routing_key] if routing_key in self.queues else []
+        kind = self.exchanges.get(exchange)
+        bound = self.bindings.get(exchange, ())
+        if kind == "fanout":
+            return sorted({queue for queue, _ in bound})
+        return sorted({queue for queue, key in bound if key == routing_key})
+
+    async def sweep(self, interval=0.05):
+        # RabbitMQ expires messages at the head of a queue even without consumers
+        while True:
+            await asyncio.sleep(interval)
+            for queue in list(self.queues.values()):
+                self.expire(queue)
+
+    def expire(self, queue):
+        now = time.monotonic()
+        while queue.messages and queue.messages[0].get("expires_at", now) < now:
+            message = queue.messages.popleft()
+            self.expired += 1
+            self.dead_letter(queue, message, "expired")
+
+    def dead_letter(self, queue, message, reason):
+        if queue.dead_letter_exchange is None:
+            return
+        message = {key: value for key, value in message.items() if key != "expires_at"}
+        death = {"reason": reason, "queue": queue.name, "count": 1}
+        message["headers"] = {**(message["headers"] or {}), "x-death": [death]}
+        for name in self.route(queue.dead_letter_exchange, message["routing_key"]):
+            self.queues[name].messages.append(message)
+            self.dispatch(self.queues[name])
+
+    def dispatch(self, queue):
+        self.expire(queue)
+        while queue.messages and queue.consumers:
+            for _ in range(len(queue.consumers)):
+                session, channel, tag = queue.consumers[queue.next_consumer % len(queue.consumers)]
+                queue.next_consumer += 1
+                if session.has_capacity(channel):
+                    break
+            else:
+                return
+            message = queue.messages.popleft()
+            delivery_tag = next(session.delivery_tags)
+            session.unacked.setdefault(channel, {})[delivery_tag] = (queue.name, message)
+            self.delivered += 1
+            session.send({"deliver": tag, "delivery_tag": delivery_tag, "routing_key": message["routing_key"],
+                          "body": message["body"], "headers": message["headers"]})
+
+    def settle(self, session, channel, delivery_tag, requeue, rejected=False):
+        entry = session.unacked.get(channel, {}).pop(delivery_tag, None)
+        if entry is None:
+            return
+        queue_name, message = entry
+        queue = self.queues.get(queue_name)
+        if requeue and queue is not None:
+            queue.messages.appendleft(message)
+        else:
+            self.acked += 1
+            if rejected and queue is not None:
+                self.dead_letter(queue, message, "rejected")
+        # A freed prefetch slot may unblock any queue this channel consumes
+        for queue in list(self.queues.values()):
+            self.dispatch(queue)
+
+    def handle(self, session, request):
+        op = request["op"]
+        if op == "channel":
+            session.prefetch[request["channel"]] = 0
+        elif op == "close_channel":
+            self.drop_channel(session, request["channel"])
+        elif op == "declare_exchange":
+            self.exchanges.setdefault(request["exchange"], request.get("type", "direct"))
+        elif op == "declare_queue":
+            name = request["queue"] or f"amq.gen-{next(self.names)}"
+            if name not in self.queues:
+                if request.get("passive"):
+                    raise LookupError(f"NOT_FOUND - no queue '{name}'")
+                self.queues[name] = _Queue(name, session if request.get("exclusive") else None,
+                                           request.get("arguments"))
+            queue = self.queues[name]
+            return {"queue": name, "message_count": len(queue.messages), "consumer_count": len(queue.consumers)}
+        elif op == "bind":
+            if request["exchange"] not in self.exchanges:
+                raise LookupError(f"NOT_FOUND - no exchange '{request['exchange']}'")
+            self.bindings.setdefault(request["exchange"], set()).add((request["queue"], request["routing_key"]))
+        elif op == "qos":
+            session.prefetch[request["channel"]] = request["prefetch"]
+        elif op == "publish":
+            message = {"routing_key": request["routing_key"], "body": request["body"], "headers": request["headers"]}
+            if request.get("expiration") is not None:
+                message["expires_at"] = time.monotonic() + float(request["expiration"])
+            for name in self.route(request["exchange"], request["routing_key"]):
+                self.queues[name].messages.append(dict(message))
+                self.dispatch(self.queues[name])
+            self.published += 1
+        elif op == "consume":
+            queue = self.queues[request["queue"]]
+            queue.consumers.append((session, request["channel"], request["tag"]))
+            self.dispatch(queue)
+        elif op == "cancel":
+            for queue in self.queues.values():
+                queue.consumers = [c for c in queue.consumers if not (c[0] is session and c[2] == request["tag"])]
+        elif op in ("ack", "reject"):
+            self.settle(session, request["channel"], request["delivery_tag"], request.get("requeue", False),
+                        rejected=op == "reject")
+        else:
+            raise ValueError(f"Unknown operation '{op}'")
+        return {}
+
+    def drop_channel(self, session, channel):
+        for queue in self.queues.values():
+            queue.consumers = [c for c in queue.consumers if not (c[0] is session and c[1] == channel)]
+        for delivery_tag in list(session.unacked.get(channel, {})):
+            self.settle(session, channel, delivery_tag, requeue=True)
+        session.unacked.pop(channel, None)
+        session.prefetch.pop(channel, None)
+
+    async def serve(self, reader, writer):
+        session = _Session(writer)
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                try:
+                    reply = self.handle(session, request)
+                except Exception as e:
+                    reply = {"error": str(e)}
+                if "id" in request:
+                    session.send({"id": request["id"], **reply})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in list(session.prefetch):
+                self.drop_channel(session, channel)
+            for name, queue in list(self.queues.items()):
+                if queue.exclusive_to is session:
+                    del self.queues[name]
+            writer.close()
+
+
+# Client: the aio_pika subset
+
+class DeliveryMode(enum.IntEnum):
+    NOT_PERSISTENT = 1
+    PERSISTENT = 2
+
+
+class ExchangeType(str, enum.Enum):
+    DIRECT = "direct"
+    FANOUT = "fanout"
+    TOPIC = "topic"
+
+
+class ChannelClosed(Exception):
+    pass
+
+
+class Message:
+    def __init__(self, body, *, headers=None, delivery_mode=None, expiration=None, **kwargs):
+        self.body = body
+        self.headers = headers or {}
+        self.delivery_mode = delivery_mode
+        self.expiration = expiration
+
+
+class IncomingMessage:
+    def __init__(self, channel, delivery):
+        self.channel = channel
+        self.delivery_tag = delivery["delivery_tag"]
+        self.routing_key = delivery["routing_key"]
+        self.body = base64.b64decode(delivery["body"])
+        self.headers = delivery["headers"]
+        self.processed = False
+
+    async def ack(self):
+        self.processed = True
+        await self.channel.connection.send({"op": "ack", "channel": self.channel.number,
+                                            "delivery_tag": self.delivery_tag})
+
+    async def reject(self, requeue=False):
+        self.processed = True
+        await self.channel.connection.send({"op": "reject", "channel": self.channel.number,
+                                            "delivery_tag": self.delivery_tag, "requeue": requeue})
+
+    async def nack(self, requeue=True):
+        await self.reject(requeue)
+
+    def process(self, requeue=False, ignore_processed=False):
+        return _ProcessContext(self, requeue, ignore_processed)
+
+
+class _ProcessContext:
+    def __init__(self, message, requeue, ignore_processed):
+        self.message = message
+        self.requeue = requeue
+        self.ignore_processed = ignore_processed
+
+    async def __aenter__(self):
+        return self.message
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.ignore_processed and self.message.processed:
+            return
+        if exc_type is None:
+            await self.message.ack()
+        else:
+            await self.message.reject(self.requeue)
+
+
+class Exchange:
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+
+    async def publish(self, message, routing_key, **kwargs):
+        await self.channel.request({"op": "publish", "exchange": self.name, "routing_key": routing_key,
+                                    "body": base64.b64encode(message.body).decode(),
+                                    "headers": message.headers, "expiration": message.expiration})
+
+
+class Queue:
+    def __init__(self, channel, name, declaration):
+        self.channel = channel
+        self.name = name
+        self.declaration_result = SimpleNamespace(**declaration)
+
+    async def bind(self, exchange, routing_key=None, **kwargs):
+        name = exchange.name if isinstance(exchange, Exchange) else exchange
+        await self.channel.request({"op": "bind", "queue": self.name, "exchange": name,
+                                    "routing_key": self.name if routing_key is None else routing_key})
+
+    async def consume(self, callback, no_ack=False, **kwargs):
+        tag = self.channel.connection.new_tag()
+
+        async def deliver(delivery):
+            message = IncomingMessage(self.channel, delivery)
+            if no_ack:
+                await message.ack()
+            await callback(message)
+
+        self.channel.connection.consumers[tag] = lambda d: asyncio.create_task(deliver(d))
+        await self.channel.request({"op": "consume", "queue": self.name, "tag": tag})
+        return tag
+
+    async def cancel(self, tag):
+        self.channel.connection.consumers.pop(tag, None)
+        await self.channel.request({"op": "cancel", "tag": tag})
+
+    def iterator(self):
+        return QueueIterator(self)
+
+
+class QueueIterator:
+    def __init__(self, queue):
+        self.queue = queue
+        self.messages = asyncio.Queue()
+        self.tag = None
+
+    async def __aenter__(self):
+        connection = self.queue.channel.connection
+        self.tag = connection.new_tag()
+        connection.consumers[self.tag] = lambda d: self.messages.put_nowait(IncomingMessage(self.queue.channel, d))
+        await self.queue.channel.request({"op": "consume", "queue": self.queue.name, "tag": self.tag})
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.queue.cancel(self.tag)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.messages.get()
+
+
+class Channel:
+    def __init__(self, connection, number):
+        self.connection = connection
+        self.number = number
+        self.is_closed = False
+
+    async def request(self, payload):
+        if self.is_closed:
+            raise ChannelClosed(f"Channel {self.number} is closed")
+        try:
+            return await self.connection.request({**payload, "channel": self.number})
+        except LookupError:
+            # Like AMQP, a failed declare or bind closes the channel
+            self.is_closed = True
+            raise
+
+    async def set_qos(self, prefetch_count=0, **kwargs):
+        await self.request({"op": "qos", "prefetch": prefetch_count})
+
+    async def declare_exchange(self, name, type=ExchangeType.DIRECT, durable=False, **kwargs):
+        kind = type.value if isinstance(type, ExchangeType) else type
+        await self.request({"op": "declare_exchange", "exchange": name, "type": kind})
+        return Exchange(self, name)
+
+    async def declare_queue(self, name="", durable=False, exclusive=False, passive=False, arguments=None,
+                            **kwargs):
+        declaration = await self.request({"op": "declare_queue", "queue": name, "exclusive": exclusive,
+                                          "passive": passive, "arguments": arguments})
+        name = declaration.pop("queue")
+        return Queue(self, name, declaration)
+
+    async def close(self):
+        if not self.is_closed:
+            self.is_closed = True
+            await self.connection.request({"op": "close_channel", "channel": self.number})
+
+
+class Connection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.consumers = {}
+        self.pending = {}
+        self.ids = itertools.count(1)
+        self.channels = itertools.count(1)
+        self.tags = itertools.count(1)
+        self.reader = self.writer = self.task = None
+
+    def new_tag(self):
+        return f"ctag-{next(self.tags)}"
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 24)
+        self.task = asyncio.create_task(self.read())
+        return self
+
+    async def read(self):
+        while line := await self.reader.readline():
+            payload = json.loads(line)
+            if "deliver" in payload:
+                consumer = self.consumers.get(payload["deliver"])
+                if consumer is not None:
+                    consumer(payload)
+                continue
+            future = self.pending.pop(payload["id"], None)
+            if future is None or future.done():
+                continue
+            if "error" in payload:
+                future.set_exception(LookupError(payload["error"]))
+            else:
+                future.set_result(payload)
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Connection to fake broker lost"))
+
+    async def send(self, payload):
+        self.writer.write(json.dumps(payload).encode() + b"\n")
+
+    async def request(self, payload):
+        request_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        await self.send({**payload, "id": request_id})
+        reply = await future
+        reply.pop("id")
+        return reply
+
+    async def channel(self, publisher_confirms=True, **kwargs):
+        channel = Channel(self, next(self.channels))
+        await self.request({"op": "channel", "channel": channel.number})
+        return channel
+
+    async def close(self):
+        self.writer.close()
+        self.task.cancel()
+
+
+async def connect_robust(url=None, *, host="localhost", port=5672, loop=None, **kwargs):
+    if url is not None:
+        parsed = urlparse(url)
+        host, port = parsed.hostname or host, parsed.port or port
+    return await Connection(host, port).connect()
+
+
+connect = connect_robust
+
+
+def install():
+    """Make ``import aio_pika`` resolve to this module."""
+    sys.modules["aio_pika"] = sys.modules[__name__]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "run":
+        sys.exit(f"usage: {sys.argv[0]} run SCRIPT [ARGS...]")
+    install()
+    script = os.path.abspath(sys.argv[2])
+    sys.argv = sys.argv[2:]
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name="__main__")
@@ -0,0 +1,171 @@
+"""Discrete-event simulation of several controller replicas sharing in-flight counts.
+
+Requests arrive (Poisson) at a random replica, as behind the controller
+Service, and are routed by that replica's own LoadTable and routing policy
+from ``controller/``. Sites serve their channel with a fixed number of
+workers, high before low, at their own speed. Each completion is reported to
+a random replica, like the dispatchers' decrements. Replicas exchange their
+ClusterView messages every sync interval with a fixed delivery delay.
+
+For each sync interval it reports per-level latency, how far the replicas'
+views are from the true in-flight counts when they route, the counts left
+in the views once everything completed, and the sync messages per second.
+``single`` is one replica with exact counts, ``none`` is replicas that do
+not share counts at all.
+
+    python benchmarks/simulate_replicas.py --replicas 4 --intervals none,1,0.1,0.01
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "controller"))
+
+from cluster import ClusterView  # noqa: E402
+from load_table import LoadTable  # noqa: E402
+from routing import ROUTING_POLICIES, UseScoreCache, make_policy  # noqa: E402
+from simulate_routing import percentile  # noqa: E402
+
+LEVELS = ("high", "low")
+
+
+class Replica:
+    def __init__(self, name, channels, policy, interval, ttl, rng):
+        self.table = LoadTable(channels, LEVELS)
+        scores = UseScoreCache(None, {}, max_age=float("inf"))
+        self.policy = make_policy(policy, self.table, scores, rng=rng)
+        self.cluster = ClusterView(self.table, replica=name, interval=interval or 1.0, ttl=ttl)
+        self.synced = bool(interval)
+
+    def pick(self, level):
+        channel = self.policy.pick(level)
+        if self.synced:
+            self.cluster.routed(channel, level)
+        return channel
+
+    def decrement(self, channel, level, now):
+        if self.table.decrement(channel, level):
+            if self.synced:
+                self.cluster.released(channel, level, now=now)
+        elif self.synced:
+            self.cluster.released(channel, level, 0, unmatched=1, now=now)
+
+
+def simulate(interval, args):
+    rng = random.Random(args.seed)
+    channels = [f"channel{i}" for i in range(args.sites)]
+    speeds = [float(s) for s in args.site_speed.split(",")] if args.site_speed else [1.0] * args.sites
+    replicas = [
+        Replica(f"r{i}", channels, args.policy, interval, args.ttl, random.Random(args.seed + 10 + i))
+        for i in range(1 if interval == "single" else args.replicas)
+    ]
+    if interval == "single":
+        interval = None
+    busy = {ch: 0 for ch in channels}
+    queues = {ch: {level: deque() for level in LEVELS} for ch in channels}
+    in_flight = {(ch, level): 0 for ch in channels for level in LEVELS}
+
+    events = []  # (time, seq, kind, payload)
+    seq = 0
+
+    def push(t, kind, payload=None):
+        nonlocal seq
+        heapq.heappush(events, (t, seq, kind, payload))
+        seq += 1
+
+    def start(ch, now, level, arrived):
+        busy[ch] += 1
+        speed = speeds[channels.index(ch)]
+        push(now + rng.expovariate(1 / args.service_time) / speed, "done", (ch, level, arrived))
+
+    push(rng.expovariate(args.rate), "arrive")
+    if interval:
+        push(interval, "sync")
+
+    latencies = {level: [] for level in LEVELS}
+    errors = []
+    messages = 0
+    now = 0.0
+    while events:
+        now, _, kind, payload = heapq.heappop(events)
+
+        if kind == "arrive":
+            level = "high" if rng.random() < args.high_ratio else "low"
+            replica = rng.choice(replicas)
+            errors.append(sum(abs(replica.table.get(*key) - n) for key, n in in_flight.items()))
+            ch = replica.pick(level)
+            in_flight[(ch, level)] += 1
+            if busy[ch] < args.workers:
+                start(ch, now, level, now)
+            else:
+                queues[ch][level].append(now)
+            nxt = now + rng.expovariate(args.rate)
+            if nxt < args.duration:
+                push(nxt, "arrive")
+
+        elif kind == "done":
+            ch, level, arrived = payload
+            busy[ch] -= 1
+            in_flight[(ch, level)] -= 1
+            latencies[level].append(now - arrived)
+            rng.choice(replicas).decrement(ch, level, now)
+            for lvl in LEVELS:
+                if queues[ch][lvl]:
+                    start(ch, now, lvl, queues[ch][lvl].popleft())
+                    break
+
+        elif kind == "sync":
+            for sender in replicas:
+                payload = sender.cluster.message()
+                for receiver in replicas:
+                    if receiver is not sender:
+                        push(now + args.sync_delay, "deliver", (receiver, payload))
+                        messages += 1
+                sender.cluster.expire(now)
+            if now < args.duration + args.service_time * 50:
+                push(now + interval, "sync")
+
+        elif kind == "deliver":
+            receiver, message = payload
+            receiver.cluster.apply(message, now=now)
+
+    residual = sum(sum(sum(c.values()) for c in r.table.snapshot().values()) for r in replicas) / len(replicas)
+    return {level: sorted(values) for level, values in latencies.items()}, errors, residual, messages / now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--intervals", default="single,none,1,0.1,0.01",
+                        help="sync intervals in seconds, 'none' for no sharing, 'single' for one replica")
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--policy", choices=ROUTING_POLICIES, default="min_count")
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--site-speed", help="comma-separated service speed per site, e.g. 1,1,2")
+    parser.add_argument("--workers", type=int, default=6, help="concurrent executions per site")
+    parser.add_argument("--rate", type=float, default=150.0, help="arrivals per second")
+    parser.add_argument("--high-ratio", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=120.0)
+    parser.add_argument("--service-time", type=float, default=0.1, help="mean service time at speed 1")
+    parser.add_argument("--sync-delay", type=float, default=0.002, help="sync message delivery delay")
+    parser.add_argument("--ttl", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'interval':<8} {'level':<5} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'view err':>9} {'residual':>9} {'msgs/s':>8}")
+    for spec in args.intervals.split(","):
+        interval = spec if spec == "single" else None if spec == "none" else float(spec)
+        latencies, errors, residual, rate = simulate(interval, args)
+        error = sum(errors) / len(errors) if errors else 0.0
+        for level, values in latencies.items():
+            if not values:
+                continue
+            print(f"{spec:<8} {level:<5} {len(values):>7} {percentile(values, 50) * 1000:>9.1f} "
+                  f"{percentile(values, 99) * 1000:>9.1f} {error:>9.2f} {residual:>9.1f} {rate:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Discrete-event simulation comparing the controller's routing policies.
+
+Requests arrive at the controller (Poisson, or replayed from a file of
+``<offset seconds> <level>`` lines) and are routed by the real LoadTable and
+routing policies from ``controller/``. Each site serves its channel with a
+fixed number of workers, high before low, and its service time is inflated
+by background load from other tenants. A fake agent samples each node every
+``--interval`` seconds and reports USE scores in the same JSON shape as
+``agent/agent.py``; the controller's UseScoreCache consumes them with the
+same lag it would have in production. The hot node rotates every
+``--phase`` seconds.
+
+    python benchmarks/simulate_routing.py --sites 3 --rate 40 --duration 600
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+from collections import deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "controller"))
+
+from load_table import LoadTable  # noqa: E402
+from routing import ROUTING_POLICIES, UseScoreCache, make_policy  # noqa: E402
+
+LEVELS = ("high", "low")
+
+
+class Site:
+    def __init__(self, channel, node, workers):
+        self.channel = channel
+        self.node = node
+        self.workers = workers
+        self.busy = 0
+        self.queues = {level: deque() for level in LEVELS}
+        self.background = 0.0  # CPU % used by other tenants
+
+    def slowdown(self, factor):
+        return 1 + factor * self.background / 100
+
+
+class FakeAgent:
+    """Reports per-node USE scores the way agent/agent.py formats them."""
+
+    def __init__(self, sites):
+        self.sites = sites
+
+    def sample(self):
+        payload = {}
+        for site in self.sites:
+            utilization = site.busy / site.workers
+            cpu = site.background + utilization * (100 - site.background)
+            saturation = min(100.0, 10.0 * sum(len(q) for q in site.queues.values()) / site.workers)
+            payload[f"{site.node}:9100"] = {
+                "cpu_utilization_percent": round(cpu, 2),
+                "cpu_saturation_iowait_percent": round(saturation, 2),
+                "disk_io_error_rate": 0.0,
+                "use_score": round(cpu + saturation, 2),
+            }
+        return payload
+
+
+def arrivals_from_args(args, rng):
+    if args.arrivals:
+        with open(args.arrivals) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[1] in LEVELS:
+                    yield float(parts[0]), parts[1]
+        return
+    t = 0.0
+    while True:
+        t += rng.expovariate(args.rate)
+        if t >= args.duration:
+            return
+        yield t, "high" if rng.random() < args.high_ratio else "low"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def simulate(policy_name, args):
+    rng = random.Random(args.seed)
+    channels = [f"channel{i}" for i in range(args.sites)]
+    sites = [Site(ch, f"10.0.0.{i + 1}", args.workers) for i, ch in enumerate(channels)]
+    by_channel = {site.channel: site for site in sites}
+
+    table = LoadTable(channels, LEVELS)
+    scores = UseScoreCache(None, {s.channel: s.node for s in sites}, max_age=float("inf"))
+    policy = make_policy(policy_name, table, scores, use_weight=args.use_weight,
+                         rng=random.Random(args.seed + 1))
+    agent = FakeAgent(sites)
+
+    events = []  # (time, seq, kind, payload)
+    seq = 0
+
+    def push(t, kind, payload=None):
+        nonlocal seq
+        heapq.heappush(events, (t, seq, kind, payload))
+        seq += 1
+
+    def start(site, now, level, arrived):
+        site.busy += 1
+        service = rng.expovariate(1 / args.service_time) * site.slowdown(args.slowdown)
+        push(now + service, "done", (site, level, arrived))
+
+    arrivals = arrivals_from_args(args, random.Random(args.seed + 2))
+    first = next(arrivals, None)
+    if first:
+        push(first[0], "arrive", first[1])
+    push(0.0, "phase", 0)
+    push(0.0, "sample")
+
+    latencies = {level: [] for level in LEVELS}
+    pending = 1 if first else 0
+    while events and (pending or any(s.busy for s in sites)):
+        now, _, kind, payload = heapq.heappop(events)
+
+        if kind == "arrive":
+            channel = policy.pick(payload)
+            site = by_channel[channel]
+            if site.busy < site.workers:
+                start(site, now, payload, now)
+            else:
+                site.queues[payload].append(now)
+            nxt = next(arrivals, None)
+            if nxt:
+                push(nxt[0], "arrive", nxt[1])
+            else:
+                pending = 0
+
+        elif kind == "done":
+            site, level, arrived = payload
+            site.busy -= 1
+            table.decrement(site.channel, level)
+            latencies[level].append(now - arrived)
+            for lvl in LEVELS:
+                if site.queues[lvl]:
+                    start(site, now, lvl, site.queues[lvl].popleft())
+                    break
+
+        elif kind == "phase":
+            hot = payload % len(sites)
+            for i, site in enumerate(sites):
+                site.background = args.hot_load if i == hot else args.base_load
+            push(now + args.phase, "phase", payload + 1)
+
+        elif kind == "sample":
+            scores.update(agent.sample(), now=now)
+            push(now + args.interval, "sample")
+
+    return {level: sorted(values) for level, values in latencies.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--policies", default=",".join(ROUTING_POLICIES))
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=6, help="concurrent executions per site")
+    parser.add_argument("--rate", type=float, default=40.0, help="arrivals per second")
+    parser.add_argument("--high-ratio", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=600.0)
+    parser.add_argument("--arrivals", help="replay '<offset seconds> <level>' lines instead of Poisson")
+    parser.add_argument("--service-time", type=float, default=0.1, help="mean service time on an idle node")
+    parser.add_argument("--base-load", type=float, default=10.0, help="background CPU %% on normal nodes")
+    parser.add_argument("--hot-load", type=float, default=80.0, help="background CPU %% on the hot node")
+    parser.add_argument("--slowdown", type=float, default=3.0,
+                        help="service time multiplier per 100%% background CPU")
+    parser.add_argument("--phase", type=float, default=60.0, help="seconds before the hot node moves")
+    parser.add_argument("--interval", type=float, default=5.0, help="agent sampling / controller poll interval")
+    parser.add_argument("--use-weight", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'policy':<10} {'level':<5} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name in args.policies.split(","):
+        for level, values in simulate(name, args).items():
+            if not values:
+                continue
+            print(f"{name:<10} {level:<5} {len(values):>7} "
+                  f"{percentile(values, 50) * 1000:>9.1f} {percentile(values, 95) * 1000:>9.1f} "
+                  f"{percentile(values, 99) * 1000:>9.1f} {values[-1] * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
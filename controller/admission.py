@@ -0,0 +1,63 @@
+import asyncio
+import math
+
+from queue_depths import QueueDepthReader
+
+
+class AdmissionController:
+    """Sheds requests once every channel is backed up past a per-level threshold.
+
+    A channel's outstanding work is the larger of its in-flight count in the
+    load table and its RabbitMQ queue depth (when depth sampling is on),
+    summed over both levels. Since routing always picks the least-loaded
+    channel, a level is only shed when even the least-loaded channel has at
+    least ``max_outstanding[level]`` outstanding. Give low a lower threshold
+    than high so low is shed first and high latency stays bounded. A
+    threshold of 0 disables shedding for that level.
+
+    ``admit()`` can defer a request for up to ``defer`` seconds, re-checking
+    every ``poll`` seconds, before giving up and answering 429.
+    """
+
+    def __init__(self, table, max_outstanding, retry_after=1.0, defer=0.0, poll=0.01):
+        self.table = table
+        self.max_outstanding = max_outstanding
+        self.retry_after = retry_after
+        self.defer = defer
+        self.poll = poll
+        self.depths = {}  # (channel, level) -> messages ready in the queue
+
+    def outstanding(self, channel):
+        total = 0
+        for level in self.table.levels:
+            total += max(self.table.get(channel, level), self.depths.get((channel, level), 0))
+        return total
+
+    def check(self, level):
+        """Return None to admit, or the Retry-After seconds to shed with."""
+        limit = self.max_outstanding.get(level, 0)
+        if not limit or not self.table.channels:
+            return None
+        if any(self.outstanding(ch) < limit for ch in self.table.channels):
+            return None
+        return math.ceil(self.retry_after)
+
+    async def admit(self, level):
+        retry_after = self.check(level)
+        if retry_after is None or not self.defer:
+            return retry_after
+        deadline = asyncio.get_running_loop().time() + self.defer
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(self.poll)
+            retry_after = self.check(level)
+            if retry_after is None:
+                return None
+        return retry_after
+
+    async def sample_queue_depths(self, connection, interval):
+        """Keep ``depths`` up to date with passive queue declarations."""
+        reader = QueueDepthReader(connection)
+        while True:
+            # A queue that failed to read keeps its last depth
+            self.depths.update(await reader.read(self.table.channels, self.table.levels))
+            await asyncio.sleep(interval)
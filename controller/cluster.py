@@ -0,0 +1,158 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+import aio_pika
+
+SYNC_EXCHANGE = "controller_sync"
+
+
+def replica_id():
+    """Unique per process, so a restarted replica is never mistaken for its old self."""
+    return f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+
+class ClusterView:
+    """Shares in-flight counts between controller replicas.
+
+    Each replica keeps its own net count per (channel, level): requests it
+    routed minus decrements it applied. Dispatchers send decrements to any
+    replica behind the Service, so a single replica's net can be negative;
+    only the sum over replicas is meaningful. ``table`` is kept at
+    max(0, own + peers) so routing and admission read it unchanged. Local
+    picks and decrements change it immediately, peers' within one sync.
+
+    Every ``interval`` seconds each replica publishes its nets (``message()``)
+    and applies those of its peers (``apply()``). A peer not heard from for
+    ``ttl`` seconds is dropped, and the live replica with the smallest id
+    adopts its last nets so the requests it routed stay counted until their
+    decrements arrive elsewhere. If the peer turns out to be alive after all,
+    the adopter gives them back.
+
+    A decrement that finds the combined count at zero is usually for a
+    request a peer routed since its last sync. It is held for up to ``ttl``
+    seconds and applied once the count is positive again, instead of being
+    dropped (which would leave that request counted for good).
+    """
+
+    def __init__(self, table, replica=None, interval=0.1, ttl=5.0):
+        self.table = table
+        self.id = replica or replica_id()
+        self.interval = interval
+        self.ttl = ttl
+        self.keys = [(ch, level) for ch in table.channels for level in table.levels]
+        self.own = dict.fromkeys(self.keys, 0)
+        self.peers = {}    # replica id -> (last seen, {(channel, level): net})
+        self.adopted = {}  # replica id -> (adopted at, {(channel, level): net})
+        self.unmatched = {key: deque() for key in self.keys}  # [received at, count] of held decrements
+        self.lock = threading.Lock()
+
+        # Counters
+        self.sent = 0
+        self.received = 0
+        self.expired = 0
+
+    def routed(self, channel, level):
+        """Count a request this replica routed (already counted in ``table`` by the pick)."""
+        with self.lock:
+            self.own[(channel, level)] += 1
+
+    def released(self, channel, level, count=1, unmatched=0, now=None):
+        """Count ``count`` decrements applied to ``table`` and hold ``unmatched`` that found it at zero."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.own[(channel, level)] -= count
+            if unmatched:
+                self.unmatched[(channel, level)].append([now, unmatched])
+
+    def message(self):
+        with self.lock:
+            net = [[ch, level, n] for (ch, level), n in self.own.items() if n]
+        return {"id": self.id, "net": net}
+
+    def apply(self, payload, now=None):
+        """Apply a peer's ``message()``; returns False for our own or malformed ones."""
+        now = time.monotonic() if now is None else now
+        try:
+            sender = payload["id"]
+            net = {(ch, level): int(n) for ch, level, n in payload["net"] if (ch, level) in self.own}
+        except (KeyError, TypeError, ValueError):
+            return False
+        if sender == self.id:
+            return False
+        with self.lock:
+            self.received += 1
+            returned = self.adopted.pop(sender, None)
+            if returned is not None:
+                for key, n in returned[1].items():
+                    self.own[key] -= n
+            self.peers[sender] = (now, net)
+        self.recompute()
+        return True
+
+    def expire(self, now=None):
+        """Drop peers silent for ``ttl`` seconds; the smallest live id adopts their nets."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for pending in self.unmatched.values():
+                while pending and now - pending[0][0] > self.ttl:
+                    pending.popleft()
+            for rid, (adopted_at, _) in list(self.adopted.items()):
+                if now - adopted_at > 10 * self.ttl:
+                    del self.adopted[rid]
+            gone = [rid for rid, (seen, _) in self.peers.items() if now - seen > self.ttl]
+            if not gone:
+                return
+            lost = {rid: self.peers.pop(rid)[1] for rid in gone}
+            self.expired += len(gone)
+            if self.id == min([self.id, *self.peers]):
+                for rid, net in lost.items():
+                    for key, n in net.items():
+                        self.own[key] += n
+                    self.adopted[rid] = (now, net)
+        self.recompute()
+
+    def recompute(self):
+        with self.lock:
+            for key in self.keys:
+                total = self.own[key] + sum(net.get(key, 0) for _, net in self.peers.values())
+                pending = self.unmatched[key]
+                while pending and total > 0:
+                    n = min(pending[0][1], total)
+                    self.own[key] -= n
+                    total -= n
+                    pending[0][1] -= n
+                    if not pending[0][1]:
+                        pending.popleft()
+                self.table.adjust(*key, max(0, total) - self.table.get(*key))
+
+    async def run(self, connection):
+        """Publish our nets and apply our peers' every ``interval`` seconds over ``connection``."""
+        channel = await connection.channel()
+        exchange = await channel.declare_exchange(SYNC_EXCHANGE, aio_pika.ExchangeType.FANOUT)
+        queue = await channel.declare_queue("", exclusive=True)
+        await queue.bind(exchange)
+
+        async def on_message(message):
+            try:
+                self.apply(json.loads(message.body))
+            except ValueError as e:
+                print(f"Ignoring malformed sync message: {e}")
+
+        # Sync messages are superseded every interval, so neither acked nor kept past the ttl
+        await queue.consume(on_message, no_ack=True)
+        while True:
+            try:
+                await exchange.publish(
+                    aio_pika.Message(body=json.dumps(self.message()).encode(), expiration=self.ttl),
+                    routing_key="",
+                )
+                self.sent += 1
+            except Exception as e:
+                print(f"Failed to publish sync message: {e}")
+            self.expire()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,126 @@
+from threading import Lock
+
+
+class _LevelHeap:
+    """Indexed binary min-heap of in-flight counts for one level.
+
+    Ordered by (count, channel index) so ties go to the lowest-numbered
+    channel, like ``min(CHANNELS, ...)`` does. ``pos`` maps a channel index to
+    its slot in ``heap`` so any channel can be re-sifted in O(log N).
+    """
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.heap = list(range(size))
+        self.pos = list(range(size))
+        self.lock = Lock()
+
+    def _less(self, a, b):
+        return (self.counts[a], a) < (self.counts[b], b)
+
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.pos[heap[i]] = i
+        self.pos[heap[j]] = j
+
+    def _sift_up(self, i):
+        while i > 0:
+            parent = (i - 1) // 2
+            if not self._less(self.heap[i], self.heap[parent]):
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i):
+        size = len(self.heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._less(self.heap[child], self.heap[smallest]):
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+    def add(self, idx, delta):
+        self.counts[idx] += delta
+        if delta > 0:
+            self._sift_down(self.pos[idx])
+        else:
+            self._sift_up(self.pos[idx])
+
+
+class LoadTable:
+    """Per-channel, per-level in-flight request counts with O(log N) updates.
+
+    Each level has its own heap and lock, so /high and /low traffic never
+    contend with each other, and picking the least-loaded channel is O(1)
+    to find plus O(log N) to re-balance after the increment.
+    """
+
+    def __init__(self, channels, levels):
+        self.channels = list(channels)
+        self.index = {ch: i for i, ch in enumerate(self.channels)}
+        self.levels = {level: _LevelHeap(len(self.channels)) for level in levels}
+
+    def pick(self, level):
+        """Return the least-loaded channel for ``level`` and count one request against it."""
+        heap = self.levels[level]
+        with heap.lock:
+            if not heap.heap:
+                raise ValueError("No channels configured")
+            idx = heap.heap[0]
+            heap.add(idx, 1)
+        return self.channels[idx]
+
+    def pick_by(self, level, cost, channels=None):
+        """Like ``pick``, but choose the channel with the lowest ``cost(channel, count)``.
+
+        Only ``channels`` (default: all) are considered. The scan and the
+        increment happen under the level's lock, so concurrent callers see
+        each other's picks. ``cost`` must not call back into the table.
+        """
+        heap = self.levels[level]
+        channels = self.channels if channels is None else channels
+        with heap.lock:
+            if not channels:
+                raise ValueError("No channels configured")
+            channel = min(channels, key=lambda ch: cost(ch, heap.counts[self.index[ch]]))
+            heap.add(self.index[channel], 1)
+        return channel
+
+    def decrement(self, channel, level):
+        """Release one request; returns False if the count was already zero."""
+        heap = self.levels[level]
+        idx = self.index[channel]
+        with heap.lock:
+            if heap.counts[idx] == 0:
+                return False
+            heap.add(idx, -1)
+        return True
+
+    def adjust(self, channel, level, delta):
+        """Apply ``delta`` to a count, clamping at zero. Returns the applied delta."""
+        heap = self.levels[level]
+        idx = self.index[channel]
+        with heap.lock:
+            delta = max(delta, -heap.counts[idx])
+            if delta:
+                heap.add(idx, delta)
+        return delta
+
+    def get(self, channel, level):
+        return self.levels[level].counts[self.index[channel]]
+
+    def snapshot(self):
+        """Return ``{channel: {level: count}}``."""
+        counts = {}
+        for level, heap in self.levels.items():
+            with heap.lock:
+                counts[level] = list(heap.counts)
+        return {
+            ch: {level: counts[level][i] for level in self.levels}
+            for i, ch in enumerate(self.channels)
+        }
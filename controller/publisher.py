@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+
+class PublishPipeline:
+    """Coalesces concurrent publishes into batches acknowledged by publisher confirms.
+
+    Callers await ``publish()``, which enqueues the message and resolves only
+    once the broker has confirmed it. A background task drains the queue into
+    batches of up to ``max_batch`` messages, waiting at most ``max_linger``
+    seconds for a batch to fill, and publishes each batch in one go so the
+    broker can acknowledge it with a single multiple-ack. Up to
+    ``max_inflight`` batches may be awaiting confirms at the same time.
+    ``on_batch(size, confirm_latency)`` is called after every confirmed batch.
+    """
+
+    def __init__(self, exchange, max_batch=100, max_linger=0.001, max_inflight=4, on_batch=None):
+        self.exchange = exchange
+        self.on_batch = on_batch
+        self.max_batch = max(1, max_batch)
+        self.max_linger = max(0.0, max_linger)
+        self.queue = asyncio.Queue()
+        self.inflight = asyncio.Semaphore(max(1, max_inflight))
+        self.task = None
+
+        # Counters
+        self.batches = 0
+        self.messages = 0
+        self.failures = 0
+        self.max_batch_seen = 0
+        self.confirm_latency_total = 0.0
+        self.confirm_latency_max = 0.0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self.task
+
+    async def publish(self, message, routing_key):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((message, routing_key, future))
+        await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_linger
+
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.inflight.acquire()
+            asyncio.create_task(self.flush(batch))
+
+    async def flush(self, batch):
+        try:
+            start = time.perf_counter()
+            results = await asyncio.gather(
+                *(self.exchange.publish(message, routing_key=routing_key)
+                  for message, routing_key, _ in batch),
+                return_exceptions=True,
+            )
+            latency = time.perf_counter() - start
+
+            self.batches += 1
+            self.messages += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.confirm_latency_total += latency
+            self.confirm_latency_max = max(self.confirm_latency_max, latency)
+            if self.on_batch is not None:
+                self.on_batch(len(batch), latency)
+
+            for (_, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, BaseException):
+                    self.failures += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(None)
+        finally:
+            self.inflight.release()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "failures": self.failures,
+            "avg_batch_size": self.messages / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_confirm_latency": self.confirm_latency_total / self.batches if self.batches else 0.0,
+            "max_confirm_latency": self.confirm_latency_max,
+            "queued": self.queue.qsize(),
+        }
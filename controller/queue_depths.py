@@ -0,0 +1,31 @@
+class QueueDepthReader:
+    """Reads the ready messages of the ``<channel>.<level>`` queues with passive declarations.
+
+    A passive declare of a missing queue closes the AMQP channel, so after a
+    failure the channel is reopened on ``connection`` and the remaining
+    queues are still read. Failed queues are left out of the result.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.channel = None
+
+    async def read(self, channels, levels):
+        """Return ``{(channel, level): ready messages}``."""
+        if self.channel is None or self.channel.is_closed:
+            self.channel = await self.connection.channel()
+        depths = {}
+        for ch in channels:
+            for level in levels:
+                try:
+                    queue = await self.channel.declare_queue(f"{ch}.{level}", passive=True)
+                    depths[(ch, level)] = queue.declaration_result.message_count
+                except Exception as e:
+                    print(f"Failed to read depth of {ch}.{level}: {e}")
+                    if self.channel.is_closed:
+                        self.channel = await self.connection.channel()
+        return depths
+
+    async def close(self):
+        if self.channel is not None and not self.channel.is_closed:
+            await self.channel.close()
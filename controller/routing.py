@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+
+def parse_channel_nodes(spec):
+    """Parse ``"channel0=10.0.0.1,channel1=10.0.0.2"`` into ``{channel: node}``."""
+    mapping = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        channel, _, node = item.partition("=")
+        mapping[channel.strip()] = node.strip()
+    return mapping
+
+
+class UseScoreCache:
+    """Per-channel USE scores pulled from the agent's /use_score endpoint.
+
+    ``run()`` polls the agent every ``interval`` seconds off the request
+    path; readers only ever look at the last good sample. Agent instances
+    are labelled ``host:port`` and are matched to channels by host. Scores
+    older than ``max_age`` are ignored so a dead agent degrades routing to
+    plain in-flight counts rather than to stale data.
+    """
+
+    def __init__(self, agent_url, channel_nodes, interval=5.0, timeout=2.0, max_age=None):
+        self.agent_url = agent_url
+        self.channel_nodes = channel_nodes
+        self.interval = interval
+        self.timeout = timeout
+        self.max_age = max_age if max_age is not None else 3 * interval
+        self.scores = {}
+        self.updated_at = None
+
+    def update(self, payload, now=None):
+        by_host = {}
+        for instance, values in payload.items():
+            by_host[instance.rsplit(":", 1)[0]] = float(values.get("use_score", 0.0))
+        self.scores = {
+            channel: by_host[node]
+            for channel, node in self.channel_nodes.items()
+            if node in by_host
+        }
+        self.updated_at = time.monotonic() if now is None else now
+
+    def score(self, channel, now=None):
+        if self.updated_at is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        if now - self.updated_at > self.max_age:
+            return 0.0
+        return self.scores.get(channel, 0.0)
+
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while True:
+                try:
+                    async with session.get(self.agent_url) as resp:
+                        resp.raise_for_status()
+                        self.update(await resp.json())
+                except Exception as e:
+                    print(f"Failed to refresh USE scores from {self.agent_url}: {e}")
+                await asyncio.sleep(self.interval)
+
+
+class MinCountPolicy:
+    """Least in-flight requests for the level (the original behaviour)."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def pick(self, level):
+        return self.table.pick(level)
+
+
+class WeightedPolicy:
+    """Weighted least-load: in-flight count scaled up by the channel's USE score.
+
+    ``cost = (count + 1) * (1 + use_weight * use_score / 100)``, so a node at
+    100% utilisation looks ``1 + use_weight`` times as loaded as an idle one
+    with the same queue. Scans all channels, which is fine for the channel
+    counts this policy is meant for.
+    """
+
+    def __init__(self, table, scores, use_weight=1.0):
+        self.table = table
+        self.scores = scores
+        self.use_weight = use_weight
+
+    def cost(self, channel, count):
+        penalty = 1 + self.use_weight * self.scores.score(channel) / 100
+        return (count + 1) * penalty
+
+    def pick(self, level):
+        return self.table.pick_by(level, self.cost)
+
+
+class PowerOfTwoPolicy(WeightedPolicy):
+    """Power-of-two-choices on the weighted cost: O(1) and herd-resistant."""
+
+    def __init__(self, table, scores, use_weight=1.0, rng=None):
+        super().__init__(table, scores, use_weight)
+        self.rng = rng or random.Random()
+
+    def pick(self, level):
+        channels = self.table.channels
+        if len(channels) < 2:
+            return self.table.pick(level)
+        return self.table.pick_by(level, self.cost, self.rng.sample(channels, 2))
+
+
+ROUTING_POLICIES = ("min_count", "weighted", "p2c")
+
+
+def make_policy(name, table, scores, use_weight=1.0, rng=None):
+    if name == "min_count":
+        return MinCountPolicy(table)
+    if name == "weighted":
+        return WeightedPolicy(table, scores, use_weight)
+    if name == "p2c":
+        return PowerOfTwoPolicy(table, scores, use_weight, rng)
+    raise ValueError(f"Unknown routing policy '{name}', expected one of {ROUTING_POLICIES}")
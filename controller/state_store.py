@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+
+from queue_depths import QueueDepthReader
+
+
+class StateStore:
+    """Snapshots a ``LoadTable`` to a JSON file and restores it on start.
+
+    Every ``interval`` seconds the counts are written to a temporary file
+    and renamed over ``path`` (skipped when nothing changed), so a crash
+    mid-write leaves the previous snapshot intact. On restore each count is
+    set to the larger of its snapshot value and the queue's ready messages:
+    the snapshot also covers requests already delivered to a dispatcher but
+    misses those routed after it was written, while the queue depth is a
+    lower bound. Snapshots older than ``max_age`` seconds are ignored.
+
+    Decrements sent while the controller is down are only delivered later
+    in the dispatcher's batch completion mode, which retries them; with
+    per-message decrements they are lost and the restored counts stay that
+    much too high.
+    """
+
+    def __init__(self, table, path, interval=1.0, max_age=300.0):
+        self.table = table
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.last = None
+        self.lock = threading.Lock()
+
+        # Counters
+        self.saves = 0
+        self.failures = 0
+
+    def save(self):
+        """Write the current counts if they changed; returns True if a snapshot was written."""
+        with self.lock:
+            counts = self.table.snapshot()
+            if counts == self.last:
+                return False
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"saved_at": time.time(), "counts": counts}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.last = counts
+            self.saves += 1
+            return True
+
+    def load(self):
+        """Return ``{channel: {level: count}}`` from the snapshot, or {} if there is no usable one."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            age = time.time() - float(data["saved_at"])
+            counts = data["counts"]
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring unreadable state snapshot {self.path}: {e}")
+            return {}
+        if age > self.max_age:
+            print(f"Ignoring state snapshot {self.path}, {age:.0f}s old")
+            return {}
+        return counts if isinstance(counts, dict) else {}
+
+    async def restore(self, connection):
+        """Seed the table from the snapshot and the live queue depths; returns the restored counts."""
+        saved = self.load()
+        reader = QueueDepthReader(connection)
+        try:
+            depths = await reader.read(self.table.channels, self.table.levels)
+        finally:
+            await reader.close()
+        for ch in self.table.channels:
+            for level in self.table.levels:
+                saved_counts = saved.get(ch)
+                count = saved_counts.get(level, 0) if isinstance(saved_counts, dict) else 0
+                if not isinstance(count, int) or count < 0:
+                    count = 0
+                target = max(count, depths.get((ch, level), 0))
+                self.table.adjust(ch, level, target - self.table.get(ch, level))
+        restored = self.table.snapshot()
+        with self.lock:
+            self.last = restored
+        return restored
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except OSError as e:
+                self.failures += 1
+                print(f"Failed to write state snapshot {self.path}: {e}")
+
+    def save_on_signal(self, loop, signals=(signal.SIGINT, signal.SIGTERM)):
+        """Write a last snapshot on ``signals``, then let the signal terminate the process."""
+        def handler(sig):
+            try:
+                self.save()
+            except OSError as e:
+                print(f"Failed to write state snapshot {self.path}: {e}")
+            signal.signal(sig, signal.SIG_DFL)
+            os.kill(os.getpid(), sig)
+
+        for sig in signals:
+            loop.add_signal_handler(sig, handler, sig)
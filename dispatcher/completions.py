@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+import aiohttp
+
+# The controller rejected the payload itself; resending it would fail the same way
+REJECTED_STATUSES = {400, 422}
+# No batch endpoint there (an older controller, or a wrong IP_CONTROLLER_BATCH)
+MISSING_STATUSES = {404, 405}
+
+
+class CompletionReporter:
+    """Aggregates per-(channel, level) completions and reports them in one call.
+
+    ``report()`` only bumps an in-memory counter. Every ``window`` seconds the
+    accumulated deltas are POSTed to the controller's ``/decrement_batch``
+    endpoint as ``{"deltas": [{"channel", "level", "count"}, ...]}``, so a
+    burst of N finished messages costs one request instead of N. Deltas from
+    a call that failed to connect, timed out or got a 5xx are merged back and
+    retried with the next window, so no decrement is lost while the
+    controller is unreachable. A 400 or 422 means the controller rejected the
+    batch itself, which would fail the same way every window, so it is
+    dropped. A 404 or 405 means there is no batch endpoint at ``url``: the
+    deltas are then sent one decrement at a time to ``fallback_url`` (the
+    per-message ``/decrement``), or kept pending if there is none. Any other
+    status is retried like a 5xx.
+    """
+
+    def __init__(self, url, window=0.05, timeout=5.0, on_flush=None, fallback_url=None):
+        self.url = url
+        self.fallback_url = fallback_url
+        self.window = window
+        self.timeout = timeout
+        self.on_flush = on_flush
+        self.pending = Counter()
+
+        # Counters
+        self.reported = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.fallbacks = 0
+
+    def report(self, channel, level, count=1):
+        self.pending[(channel, level)] += count
+
+    async def flush(self, session):
+        if not self.pending:
+            return
+        deltas, self.pending = self.pending, Counter()
+        body = {"deltas": [
+            {"channel": channel, "level": level, "count": count}
+            for (channel, level), count in deltas.items()
+        ]}
+        start = time.perf_counter()
+        try:
+            async with session.post(self.url, json=body) as resp:
+                text = await resp.text()
+                if resp.status in REJECTED_STATUSES:
+                    self.dropped += sum(deltas.values())
+                    logging.error(
+                        f"Controller rejected {sum(deltas.values())} completions with "
+                        f"{resp.status}, dropping them: {text.strip()}"
+                    )
+                    return
+                if resp.status in MISSING_STATUSES:
+                    logging.error(
+                        f"No batch endpoint at {self.url} ({resp.status}), "
+                        + (f"falling back to {self.fallback_url}" if self.fallback_url
+                           else f"keeping {sum(deltas.values())} completions pending")
+                    )
+                    if self.fallback_url is None:
+                        self.failures += 1
+                        self.pending.update(deltas)
+                    else:
+                        await self.flush_single(session, deltas)
+                    return
+                resp.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            self.pending.update(deltas)
+            logging.error(f"Failed to report {sum(deltas.values())} completions to {self.url}: {e}")
+            return
+        self.batches += 1
+        self.reported += sum(deltas.values())
+        if self.on_flush is not None:
+            self.on_flush(sum(deltas.values()), time.perf_counter() - start)
+
+    async def flush_single(self, session, deltas):
+        """Send ``deltas`` as one ``fallback_url`` call per completion; unsent ones stay pending."""
+        remaining = Counter(deltas)
+        try:
+            for (channel, level), count in deltas.items():
+                for _ in range(count):
+                    async with session.post(self.fallback_url, json={"channel": channel, "level": level}) as resp:
+                        await resp.read()
+                        rejected = resp.status in REJECTED_STATUSES
+                        if not rejected:
+                            resp.raise_for_status()
+                    remaining[(channel, level)] -= 1
+                    self.fallbacks += 1
+                    if rejected:
+                        self.dropped += 1
+                    else:
+                        self.reported += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.failures += 1
+            self.pending.update(+remaining)
+            logging.error(f"Failed to report {sum(remaining.values())} completions to {self.fallback_url}: {e}")
+
+    async def run(self):
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            try:
+                while True:
+                    await asyncio.sleep(self.window)
+                    await self.flush(session)
+            finally:
+                # Shutting down: report whatever has completed
+                await self.flush(session)
@@ -1,6 +1,5 @@
 import asyncio
 import aio_pika
-import aiohttp
 import logging
 import signal
 import sys
@@ -8,136 +7,439 @@ import json
 import time
 import os
 
-from opentelemetry import trace, context
-from opentelemetry.sdk.resources import SERVICE_NAME, Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
-from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import CounterMetricFamily
+
+from contextlib import nullcontext
+
+from completions import CompletionReporter
+from executor_client import ExecutorClient
+from limiter import LIMIT_ALGORITHMS, make_limit
+from message_tracing import attach_context, detach_context, faas_span, message_span, trace_headers
+from metrics_writer import LatencyLogWriter
+from scheduler import PriorityScheduler, parse_level_values
+from tracing_setup import setup_tracing
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-rabbitmq_host = "my-rabbitmq.default.svc.cluster.local"
-rabbitmq_port = 5672
-username = "myuser"
-password = "mypassword"
+rabbitmq_host = os.getenv("RABBITMQ_HOST", "my-rabbitmq.default.svc.cluster.local")
+rabbitmq_port = int(os.getenv("RABBITMQ_PORT", "5672"))
+username = os.getenv("RABBITMQ_USER", "myuser")
+password = os.getenv("RABBITMQ_PASSWORD", "mypassword")
 
 stop_event = asyncio.Event()
 
 curl_target_url = os.getenv("IP_CONTROLLER",  "http://192.168.17.121:30081/decrement")
 
+# Completion reporting: "batch" aggregates decrements per (channel, level) and
+# sends them to /decrement_batch every COMPLETION_WINDOW_MS; "single" POSTs
+# /decrement once per message
+COMPLETION_MODE = os.getenv("COMPLETION_MODE", "batch")
+COMPLETION_URL = os.getenv("IP_CONTROLLER_BATCH", curl_target_url.rsplit("/", 1)[0] + "/decrement_batch")
+COMPLETION_WINDOW_MS = float(os.getenv("COMPLETION_WINDOW_MS", "50"))
+
 ip_executor = os.getenv("IP_EXECUTOR", "default_ip")  # fallback if not set
 request_channel = os.getenv("CHANNEL", "default_channel") 
 
-# OpenTelemetry setup
-trace.set_tracer_provider(
-    TracerProvider(resource=Resource.create({SERVICE_NAME: "dispatcher"}))
+# Must match the controller's EXPIRED_EXCHANGE: RabbitMQ rejects redeclaring a
+# queue with different arguments
+EXPIRED_EXCHANGE = os.getenv("EXPIRED_EXCHANGE", "")
+QUEUE_ARGUMENTS = {"x-dead-letter-exchange": EXPIRED_EXCHANGE} if EXPIRED_EXCHANGE else None
+
+# Consumer engine: in-flight handlers and broker prefetch per queue
+HIGH_CONCURRENCY = int(os.getenv("HIGH_CONCURRENCY", "5"))
+HIGH_PREFETCH = int(os.getenv("HIGH_PREFETCH", str(HIGH_CONCURRENCY)))
+LOW_CONCURRENCY = int(os.getenv("LOW_CONCURRENCY", "1"))
+LOW_PREFETCH = int(os.getenv("LOW_PREFETCH", str(LOW_CONCURRENCY)))
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))
+
+# Adaptive concurrency: "aimd" or "gradient" moves each queue's concurrency and
+# prefetch (starting from the values above) within LIMIT_MIN..LIMIT_MAX from the
+# executor's latency and errors; "off" keeps them fixed
+ADAPTIVE_LIMIT = os.getenv("ADAPTIVE_LIMIT", "off")
+LIMIT_MIN = parse_level_values(os.getenv("LIMIT_MIN", ""), {"high": 1, "low": 1})
+LIMIT_MAX = parse_level_values(os.getenv("LIMIT_MAX", ""), {"high": 100, "low": 50})
+LIMIT_AIMD_BACKOFF = float(os.getenv("LIMIT_AIMD_BACKOFF", "0.9"))
+LIMIT_AIMD_TIMEOUT = float(os.getenv("LIMIT_AIMD_TIMEOUT", "5"))  # slower calls count as drops
+LIMIT_GRADIENT_TOLERANCE = float(os.getenv("LIMIT_GRADIENT_TOLERANCE", "1.5"))
+LIMIT_GRADIENT_SMOOTHING = float(os.getenv("LIMIT_GRADIENT_SMOOTHING", "0.2"))
+if ADAPTIVE_LIMIT == "aimd":
+    limit_options = {"backoff": LIMIT_AIMD_BACKOFF, "timeout": LIMIT_AIMD_TIMEOUT}
+else:
+    limit_options = {"tolerance": LIMIT_GRADIENT_TOLERANCE, "smoothing": LIMIT_GRADIENT_SMOOTHING}
+limits = {}
+if ADAPTIVE_LIMIT in LIMIT_ALGORITHMS:
+    for level, initial in (("high", HIGH_CONCURRENCY), ("low", LOW_CONCURRENCY)):
+        limits[level] = make_limit(
+            ADAPTIVE_LIMIT, initial, int(LIMIT_MIN[level]), int(LIMIT_MAX[level]), **limit_options
+        )
+elif ADAPTIVE_LIMIT != "off":
+    raise ValueError(f"Unknown ADAPTIVE_LIMIT '{ADAPTIVE_LIMIT}', expected off or one of {LIMIT_ALGORITHMS}")
+
+# Shared executor client: pooled keep-alive connections, timeouts, retries, hedging
+EXECUTOR_MAX_CONNECTIONS = int(os.getenv("EXECUTOR_MAX_CONNECTIONS", "100"))
+EXECUTOR_LIMIT_PER_HOST = int(os.getenv("EXECUTOR_LIMIT_PER_HOST", "50"))
+EXECUTOR_KEEPALIVE = float(os.getenv("EXECUTOR_KEEPALIVE", "30"))
+EXECUTOR_DNS_TTL = int(os.getenv("EXECUTOR_DNS_TTL", "300"))
+EXECUTOR_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT", "30"))
+EXECUTOR_CONNECT_TIMEOUT = float(os.getenv("EXECUTOR_CONNECT_TIMEOUT", "3"))
+EXECUTOR_RETRIES = int(os.getenv("EXECUTOR_RETRIES", "2"))
+EXECUTOR_BACKOFF_MS = float(os.getenv("EXECUTOR_BACKOFF_MS", "50"))
+EXECUTOR_HEDGE_HIGH = os.getenv("EXECUTOR_HEDGE_HIGH", "1") == "1"
+EXECUTOR_HEDGE_PERCENTILE = float(os.getenv("EXECUTOR_HEDGE_PERCENTILE", "95"))
+executor = ExecutorClient(
+    limit=EXECUTOR_MAX_CONNECTIONS,
+    limit_per_host=EXECUTOR_LIMIT_PER_HOST,
+    keepalive=EXECUTOR_KEEPALIVE,
+    dns_ttl=EXECUTOR_DNS_TTL,
+    timeout=EXECUTOR_TIMEOUT,
+    connect_timeout=EXECUTOR_CONNECT_TIMEOUT,
+    retries=EXECUTOR_RETRIES,
+    backoff=EXECUTOR_BACKOFF_MS / 1000,
+    hedge_percentile=EXECUTOR_HEDGE_PERCENTILE,
+)
+
+# Scheduler stage: global cap on concurrent executor calls, shared by both queues.
+# It must stay below the queues' combined concurrency, or no message ever waits for
+# a slot and SCHEDULER_POLICY has nothing to order. Unset (0), it is the high queue's
+# concurrency; with adaptive limits it then follows the high queue's current limit
+EXECUTOR_CONCURRENCY = int(os.getenv("EXECUTOR_CONCURRENCY", "0"))
+SCHEDULER_FOLLOWS_LIMIT = bool(limits) and not EXECUTOR_CONCURRENCY
+if not EXECUTOR_CONCURRENCY:
+    EXECUTOR_CONCURRENCY = limits["high"].limit if limits else HIGH_CONCURRENCY
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "strict")  # "strict", "wfq" or "deadline"
+SCHEDULER_WEIGHTS = parse_level_values(os.getenv("SCHEDULER_WEIGHTS", ""), {"high": 4.0, "low": 1.0})
+SCHEDULER_TARGETS = parse_level_values(os.getenv("SCHEDULER_TARGETS", ""), {"high": 0.1, "low": 2.0})
+scheduler = PriorityScheduler(
+    EXECUTOR_CONCURRENCY, SCHEDULER_POLICY, weights=SCHEDULER_WEIGHTS, targets=SCHEDULER_TARGETS
+)
+
+# Latency log: buffered in memory, flushed to disk in batches off the event loop
+latency_log = LatencyLogWriter(
+    os.getenv("LATENCY_LOG_PATH", "latency_metrics.txt"),
+    fmt=os.getenv("LATENCY_LOG_FORMAT", "text"),  # "text" or "csv"
+    flush_size=int(os.getenv("LATENCY_FLUSH_SIZE", "1000")),
+    flush_interval=float(os.getenv("LATENCY_FLUSH_INTERVAL", "1.0")),
+    max_buffer=int(os.getenv("LATENCY_BUFFER_MAX", "100000")),
+)
+
+# Prometheus metrics, served on METRICS_PORT at /metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9000"))
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+QUEUE_WAIT = Histogram(
+    "dispatcher_queue_wait_seconds", "Time from controller publish (send_ts) to delivery",
+    ["level"], buckets=LATENCY_BUCKETS,
+)
+KNATIVE_CALL = Histogram(
+    "dispatcher_knative_call_seconds", "Knative function call time",
+    ["level"], buckets=LATENCY_BUCKETS,
 )
-tracer = trace.get_tracer("dispatcher")
-jaeger_exporter = JaegerExporter(
-    collector_endpoint="http://jaeger.observability.svc.cluster.local:14268/api/traces"
+DECREMENT_CALL = Histogram(
+    "dispatcher_decrement_call_seconds", "Controller /decrement call time",
+    ["level"], buckets=LATENCY_BUCKETS,
 )
-trace.get_tracer_provider().add_span_processor(BatchSpanProcessor(jaeger_exporter))
+COMPLETION_BATCH_CALL = Histogram(
+    "dispatcher_completion_batch_seconds", "Controller /decrement_batch call time",
+    buckets=LATENCY_BUCKETS,
+)
+COMPLETION_BATCH_SIZE = Histogram(
+    "dispatcher_completion_batch_size", "Decrements reported per /decrement_batch call",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+EXPIRED = Counter(
+    "dispatcher_expired_messages", "Messages past their deadline_ts, completed without calling the executor",
+    ["level"],
+)
+IN_FLIGHT = Gauge("dispatcher_in_flight_messages", "Messages being handled per queue", ["queue"])
+CONCURRENCY_LIMIT = Gauge(
+    "dispatcher_concurrency_limit", "Messages handled at once per queue (adaptive with ADAPTIVE_LIMIT)", ["queue"],
+)
+EXECUTOR_ACTIVE = Gauge("dispatcher_executor_active_calls", "Executor slots held")
+EXECUTOR_WAITING = Gauge("dispatcher_executor_waiting", "Messages waiting for an executor slot", ["level"])
+EXECUTOR_ACTIVE.set_function(lambda: scheduler.active)
+for level in ("high", "low"):
+    EXECUTOR_WAITING.labels(level=level).set_function(lambda level=level: scheduler.waiting(level))
+
+class ExecutorClientCollector:
+    def collect(self):
+        for name, help_text, value in (
+            ("dispatcher_executor_calls", "Executor calls made", executor.calls),
+            ("dispatcher_executor_retries", "Executor calls retried after an error or 5xx", executor.retried),
+            ("dispatcher_executor_hedges", "Hedged executor requests sent", executor.hedged),
+            ("dispatcher_executor_hedge_wins", "Hedged requests that answered first", executor.hedge_wins),
+        ):
+            yield CounterMetricFamily(name, help_text, value=value)
+
+REGISTRY.register(ExecutorClientCollector())
+
+class AdaptiveLimitCollector:
+    def collect(self):
+        if not limits:
+            return
+        samples = CounterMetricFamily(
+            "dispatcher_limit_samples", "Executor calls sampled by the adaptive limit", labels=["level"]
+        )
+        drops = CounterMetricFamily(
+            "dispatcher_limit_drops", "Sampled executor calls that failed or were too slow", labels=["level"]
+        )
+        for level, limit in limits.items():
+            samples.add_metric([level], limit.samples)
+            drops.add_metric([level], limit.drops)
+        yield samples
+        yield drops
+
+REGISTRY.register(AdaptiveLimitCollector())
+
+def observe_completions(count, seconds):
+    COMPLETION_BATCH_SIZE.observe(count)
+    COMPLETION_BATCH_CALL.observe(seconds)
+
+completions = CompletionReporter(
+    COMPLETION_URL, window=COMPLETION_WINDOW_MS / 1000, on_flush=observe_completions,
+    fallback_url=curl_target_url,
+)
+
+# OpenTelemetry setup (sampling and exporter settings in tracing_setup)
+tracer = setup_tracing("dispatcher")
 
 def shutdown():
     logging.info("Shutdown signal received. Stopping consumer...")
     stop_event.set()
 
-async def consume_queue(queue_name, channel):
-    queue = await channel.declare_queue(queue_name, durable=True)
-    logging.info(f"Waiting for messages on queue '{queue_name}'...")
-
-    async with queue.iterator() as queue_iter, aiohttp.ClientSession() as session:
-        async for message in queue_iter:
-            if stop_event.is_set():
-                break
-
-            # Extract trace context from message headers
-            headers = {}
-            if message.headers:
-                # RabbitMQ headers can be nested or byte encoded, normalize if needed
-                for k, v in message.headers.items():
-                    if isinstance(v, bytes):
-                        headers[k] = v.decode()
-                    else:
-                        headers[k] = str(v)
-
-            ctx = TraceContextTextMapPropagator().extract(headers)
-            
-            token = context.attach(ctx)
-            
-            send_ts = float(headers.get("send_ts", 0))  # This is the sender's time.time()
-            recv_ts = time.time()                      # This is now
-
-            latency = recv_ts - send_ts
-        
-            log_line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} Latency in {queue_name}: {latency:.6f} seconds\n"
-            
-            with open("latency_metrics.txt", "a") as f:
-                f.write(log_line)
-            logging.info(f"Latency in {queue_name}: {latency:.6f} seconds")
-            try:
-                async with message.process():
-                    decoded = message.body.decode()
-                    logging.info(f"[{queue_name}] Received message: {decoded}")
-
-                    with tracer.start_as_current_span(f"process_message_{queue_name}") as span:
-                        span.set_attribute("messaging.system", "rabbitmq")
-                        span.set_attribute("messaging.destination", queue_name)
-                        span.set_attribute("messaging.message_payload_size_bytes", len(message.body))
-                        if queue_name.endswith("high"):
-                            headers = {
-                                "Host": f"highpriorityfunc.default.{ip_executor}.sslip.io"
-                            }
-                            url = f"http://{ip_executor}"
-                            priority = "high"
-                        elif queue_name.endswith("low"):
-                            headers = {
-                                "Host": f"lowpriorityfunc.default.{ip_executor}.sslip.io"
-                            }
-                            url = f"http://{ip_executor}"
-                            priority = "low"
-                        else: 
-                            logging.error(f"Unexpected queue_name: {queue_name}")
-                        # Inject current trace context into HTTP headers for downstream propagation
-                        http_headers = {}
-                        TraceContextTextMapPropagator().inject(http_headers)
-                        # Merge with your custom headers for the request
-                        http_headers.update(headers)
-
-                        # Send GET request with tracing headers
-                        with tracer.start_as_current_span(f"FaaS_calling_{priority}") as span:
-                            span.set_attribute("faas.system", "knative")
-
-                            async with session.get(url, headers=http_headers) as resp:
-                                resp_text = await resp.text()
-                                logging.info(f"[{queue_name}] HTTP {resp.status}: {resp_text}")
-                                span.set_attribute("http.status_code", resp.status)
-
-                        channel_base = queue_name.split('.')[0]
-
-                        # Prepare JSON data to POST (tracing context injected here too)
-                        json_data = {
-                            "channel": channel_base,
-                            "level": priority,
-                        }
-
-                        # For POST also propagate trace context
-                        post_headers = {}
-                        TraceContextTextMapPropagator().inject(post_headers)
-
-                        async with session.post(curl_target_url, json=json_data, headers=post_headers) as post_resp:
-                            post_resp_text = await post_resp.text()
-                            logging.info(f"[{queue_name}] POST {post_resp.status}: {post_resp_text}")
-                            span.set_attribute("http.post_status_code", post_resp.status)
+async def post_decrement(executor, queue_name, channel_base, priority, span):
+    # Prepare JSON data to POST (tracing context injected here too)
+    json_data = {
+        "channel": channel_base,
+        "level": priority,
+    }
+
+    # For POST also propagate trace context
+    post_headers = trace_headers()
+
+    with DECREMENT_CALL.labels(level=priority).time():
+        post_status, post_resp_text = await executor.post(curl_target_url, json=json_data, headers=post_headers)
+    logging.info(f"[{queue_name}] POST {post_status}: {post_resp_text}")
+    span.set_attribute("http.post_status_code", post_status)
+
+
+async def call_executor(executor, queue_name, priority, url, http_headers):
+    with faas_span(tracer, priority) as span:
+        limit = limits.get(priority)
+        measure = limit.measure() if limit else nullcontext()
+        with KNATIVE_CALL.labels(level=priority).time(), measure as sample:
+            status, resp_text = await executor.get(
+                url, http_headers, hedge=EXECUTOR_HEDGE_HIGH and priority == "high"
+            )
+            if sample is not None:
+                sample.dropped = status >= 500 or status == 429
+        logging.info(f"[{queue_name}] HTTP {status}: {resp_text}")
+        span.set_attribute("http.status_code", status)
+
+
+async def process_message(message, queue_name, executor):
+    # Extract trace context from message headers
+    headers = {}
+    if message.headers:
+        # RabbitMQ headers can be nested or byte encoded, normalize if needed
+        for k, v in message.headers.items():
+            if isinstance(v, bytes):
+                headers[k] = v.decode()
+            else:
+                headers[k] = str(v)
+
+    token = attach_context(headers)
+
+    send_ts = float(headers.get("send_ts", 0))  # This is the sender's time.time()
+    recv_ts = time.time()                      # This is now
+    deadline = float(headers.get("deadline_ts", 0))  # 0: no deadline
+
+    latency = recv_ts - send_ts
+
+    latency_log.record(queue_name, latency, recv_ts)
+    QUEUE_WAIT.labels(level=queue_name.rsplit('.', 1)[-1]).observe(latency)
+    logging.info(f"Latency in {queue_name}: {latency:.6f} seconds")
+    try:
+        async with message.process():
+            decoded = message.body.decode()
+            logging.info(f"[{queue_name}] Received message: {decoded}")
+
+            with message_span(tracer, queue_name, len(message.body)) as span:
+                if queue_name.endswith("high"):
+                    headers = {
+                        "Host": f"highpriorityfunc.default.{ip_executor}.sslip.io"
+                    }
+                    url = f"http://{ip_executor}"
+                    priority = "high"
+                elif queue_name.endswith("low"):
+                    headers = {
+                        "Host": f"lowpriorityfunc.default.{ip_executor}.sslip.io"
+                    }
+                    url = f"http://{ip_executor}"
+                    priority = "low"
+                else: 
+                    logging.error(f"Unexpected queue_name: {queue_name}")
+                # Inject current trace context into HTTP headers for downstream propagation
+                http_headers = trace_headers()
+                # Merge with your custom headers for the request
+                http_headers.update(headers)
+
+                # Send GET request with tracing headers once the scheduler grants an executor
+                # slot, unless the message's deadline passed while it was queued
+                expired = 0 < deadline < time.time()
+                if not expired:
+                    async with scheduler.slot(priority):
+                        # The wait for a slot may have used up the rest of the deadline
+                        expired = 0 < deadline < time.time()
+                        if not expired:
+                            await call_executor(executor, queue_name, priority, url, http_headers)
+                if expired:
+                    EXPIRED.labels(level=priority).inc()
+                    span.set_attribute("messaging.expired", True)
+                    logging.info(
+                        f"[{queue_name}] Deadline passed {time.time() - deadline:.3f}s ago, not calling the executor"
+                    )
+
+                channel_base = queue_name.split('.')[0]
+
+                if COMPLETION_MODE == "batch":
+                    completions.report(channel_base, priority)
+                else:
+                    await post_decrement(executor, queue_name, channel_base, priority, span)
 
-            except Exception as e:
-                logging.error(f"[{queue_name}] Failed to process message: {e}")
+    except Exception as e:
+        logging.error(f"[{queue_name}] Failed to process message: {e}")
+    finally:
+        detach_context(token)
+
+
+class QueueConsumer:
+    """Consumes one queue on its own channel with bounded concurrent handlers.
+
+    The broker delivers up to ``prefetch`` unacknowledged messages and up to
+    ``concurrency`` of them are processed at the same time, each in its own
+    task, so a slow Knative call no longer holds up the messages behind it.
+    Given an adaptive ``limit``, concurrency and prefetch both follow it,
+    and ``on_resize(concurrency)`` is called after each change.
+    """
+
+    def __init__(self, queue_name, prefetch, concurrency, limit=None, on_resize=None):
+        self.queue_name = queue_name
+        self.on_resize = on_resize
+        self.prefetch = max(prefetch, concurrency)
+        self.concurrency = concurrency
+        if limit is not None:
+            self.prefetch = self.concurrency = limit.limit
+            limit.on_change = self.resize
+        self.slot_freed = asyncio.Event()
+        self.tasks = set()
+        self.processed = 0
+        self.channel = None
+        self.qos_task = None
+        IN_FLIGHT.labels(queue=queue_name).set_function(lambda: len(self.tasks))
+        CONCURRENCY_LIMIT.labels(queue=queue_name).set_function(lambda: self.concurrency)
+
+    @property
+    def in_flight(self):
+        return len(self.tasks)
+
+    async def run(self, connection, executor):
+        self.channel = channel = await connection.channel()
+        await channel.set_qos(prefetch_count=self.prefetch)
+        queue = await channel.declare_queue(self.queue_name, durable=True, arguments=QUEUE_ARGUMENTS)
+        logging.info(
+            f"Waiting for messages on queue '{self.queue_name}' "
+            f"(prefetch={self.prefetch}, concurrency={self.concurrency})..."
+        )
+
+        async with queue.iterator() as queue_iter:
+            try:
+                async for message in queue_iter:
+                    if stop_event.is_set():
+                        break
+                    while len(self.tasks) >= self.concurrency:
+                        self.slot_freed.clear()
+                        await self.slot_freed.wait()
+                    task = asyncio.create_task(self.handle(message, executor))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.task_done)
             finally:
-                context.detach(token)
+                # Let in-flight messages finish before the executor client closes
+                await self.drain()
+
+    async def handle(self, message, executor):
+        try:
+            await process_message(message, self.queue_name, executor)
+        finally:
+            self.processed += 1
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        self.slot_freed.set()
+
+    def resize(self, concurrency):
+        """Handle up to ``concurrency`` messages at once, and have the broker prefetch as many."""
+        self.concurrency = concurrency
+        self.slot_freed.set()
+        if self.on_resize is not None:
+            self.on_resize(concurrency)
+        if self.channel is not None and (self.qos_task is None or self.qos_task.done()):
+            self.qos_task = asyncio.create_task(self.update_prefetch())
+
+    async def update_prefetch(self):
+        # One basic.qos at a time; changes made meanwhile are picked up by the loop
+        while self.prefetch != self.concurrency:
+            self.prefetch = self.concurrency
+            try:
+                await self.channel.set_qos(prefetch_count=self.prefetch)
+            except Exception as e:
+                logging.warning(f"[{self.queue_name}] Failed to set prefetch to {self.prefetch}: {e}")
+                return
+
+    async def drain(self):
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def report_consumers(consumers):
+    while True:
+        await asyncio.sleep(METRICS_INTERVAL)
+        for consumer in consumers:
+            logging.info(
+                f"[{consumer.queue_name}] in_flight={consumer.in_flight}/{consumer.concurrency} "
+                f"prefetch={consumer.prefetch} processed={consumer.processed}"
+            )
+        for level, limit in limits.items():
+            logging.info(
+                f"[limit.{level}] {ADAPTIVE_LIMIT} limit={limit.limit} samples={limit.samples} drops={limit.drops}"
+            )
+        logging.info(
+            f"[latency_log] written={latency_log.written} dropped={latency_log.dropped} "
+            f"buffered={len(latency_log.buffer)} flushes={latency_log.flushes} "
+            f"flush_time={latency_log.flush_seconds:.3f}s"
+        )
+        logging.info(
+            f"[executor] calls={executor.calls} retries={executor.retried} hedged={executor.hedged} "
+            f"hedge_wins={executor.hedge_wins} hedge_delay={executor.hedge_delay}"
+        )
+        logging.info(
+            f"[completions] mode={COMPLETION_MODE} reported={completions.reported} "
+            f"batches={completions.batches} failures={completions.failures} dropped={completions.dropped} "
+            f"fallbacks={completions.fallbacks} pending={sum(completions.pending.values())}"
+        )
+        logging.info(
+            f"[scheduler] policy={scheduler.policy} executing={scheduler.active}/{scheduler.limit} "
+            f"waiting high={scheduler.waiting('high')} low={scheduler.waiting('low')}"
+        )
 
 
 async def main():
+    # Registered on the running loop; asyncio.run() creates a new one
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, shutdown)
+
     try:
         connection = await aio_pika.connect_robust(
             host=rabbitmq_host,
@@ -147,31 +449,32 @@ async def main():
         )
         logging.info(f"Connected to RabbitMQ at {rabbitmq_host}:{rabbitmq_port}")
 
-        channel = await connection.channel()
-        await channel.set_qos(prefetch_count=1)
-
-        # High priority: 5 workers
-        high_priority_tasks = [
-            asyncio.create_task(consume_queue(f"{request_channel}.high", channel))
-            for _ in range(5)
-        ]
-
-        # Low priority: 1 worker
-        low_priority_tasks = [
-            asyncio.create_task(consume_queue(f"{request_channel}.low", channel))
-        ]
-
-        tasks = high_priority_tasks + low_priority_tasks
-
-        await stop_event.wait()
-
-        # Cancel all running tasks on shutdown
-        for task in tasks:
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                logging.info("Consumer task cancelled.")
+        start_http_server(METRICS_PORT)
+        logging.info(f"Serving metrics on :{METRICS_PORT}/metrics")
+
+        async with executor:
+            consumers = [
+                QueueConsumer(
+                    f"{request_channel}.high", HIGH_PREFETCH, HIGH_CONCURRENCY, limits.get("high"),
+                    on_resize=scheduler.resize if SCHEDULER_FOLLOWS_LIMIT else None,
+                ),
+                QueueConsumer(f"{request_channel}.low", LOW_PREFETCH, LOW_CONCURRENCY, limits.get("low")),
+            ]
+            tasks = [asyncio.create_task(consumer.run(connection, executor)) for consumer in consumers]
+            tasks.append(asyncio.create_task(report_consumers(consumers)))
+            tasks.append(asyncio.create_task(latency_log.run()))
+            if COMPLETION_MODE == "batch":
+                tasks.append(asyncio.create_task(completions.run()))
+
+            await stop_event.wait()
+
+            # Cancel all running tasks on shutdown; consumers let in-flight messages finish
+            for task in tasks:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    logging.info("Consumer task cancelled.")
 
         await connection.close()
         logging.info("Connection closed gracefully.")
@@ -181,10 +484,6 @@ async def main():
 
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(sig, shutdown)
-
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
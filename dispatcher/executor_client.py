@@ -0,0 +1,123 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+RETRY_STATUSES = {502, 503, 504}
+
+
+class ExecutorClient:
+    """One pooled HTTP client toward the Knative executor, shared by all consumers.
+
+    Connections are kept alive and capped per host, DNS lookups are cached,
+    and every call has a total and a connect timeout. Connection errors,
+    timeouts and 502/503/504 responses are retried up to ``retries`` times
+    with exponential backoff and full jitter.
+
+    Hedged calls (``hedge=True``) send a second identical request when the
+    first has not answered within the ``hedge_percentile`` latency of recent
+    calls, and use whichever finishes first. Since the delay tracks the tail,
+    only roughly ``100 - hedge_percentile`` percent of calls are duplicated.
+    No hedging happens until ``hedge_min_samples`` latencies have been seen.
+    """
+
+    def __init__(self, limit=100, limit_per_host=50, keepalive=30.0, dns_ttl=300,
+                 timeout=30.0, connect_timeout=3.0, retries=2, backoff=0.05, max_backoff=1.0,
+                 hedge_percentile=95.0, hedge_min_delay=0.01, hedge_min_samples=50):
+        self.connector_args = dict(
+            limit=limit, limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive, ttl_dns_cache=dns_ttl,
+        )
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=1000)
+        self.hedge_delay = None
+        self.since_recompute = 0
+        self.session = None
+
+        # Counters
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(**self.connector_args), timeout=self.timeout
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _observe(self, latency):
+        self.latencies.append(latency)
+        self.since_recompute += 1
+        # Recompute the hedge delay every 50 samples rather than on every call
+        if len(self.latencies) >= self.hedge_min_samples and self.since_recompute >= 50:
+            self.since_recompute = 0
+            ordered = sorted(self.latencies)
+            idx = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+            self.hedge_delay = max(self.hedge_min_delay, ordered[idx])
+
+    async def _attempt(self, url, headers):
+        start = time.perf_counter()
+        async with self.session.get(url, headers=headers) as resp:
+            text = await resp.text()
+        if resp.status < 500:
+            self._observe(time.perf_counter() - start)
+        return resp.status, text
+
+    async def _hedged_attempt(self, url, headers):
+        first = asyncio.create_task(self._attempt(url, headers))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        self.hedged += 1
+        second = asyncio.create_task(self._attempt(url, headers))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get(self, url, headers=None, hedge=False):
+        """GET ``url``; returns (status, text) of the first usable response."""
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                if hedge and self.hedge_delay is not None:
+                    status, text = await self._hedged_attempt(url, headers)
+                else:
+                    status, text = await self._attempt(url, headers)
+                if status not in RETRY_STATUSES or attempt >= self.retries:
+                    return status, text
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+            self.retried += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            attempt += 1
+
+    async def post(self, url, **kwargs):
+        async with self.session.post(url, **kwargs) as resp:
+            return resp.status, await resp.text()
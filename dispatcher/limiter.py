@@ -0,0 +1,134 @@
+import asyncio
+import math
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+LIMIT_ALGORITHMS = ("aimd", "gradient")
+
+
+class AdaptiveLimit:
+    """Concurrency limit adjusted from the latency and outcome of each call.
+
+    Wrap every call in ``measure()`` and mark the yielded sample ``dropped``
+    for a failed or overloaded response; exceptions count as dropped, and
+    cancelled calls are not sampled. After each sample the subclass computes
+    a new limit, kept within ``[min_limit, max_limit]``, and
+    ``on_change(limit)`` is called whenever its integer value changes. Only
+    samples taken with at least half the limit in flight may raise it, so a
+    quiet period does not grow the limit past what was ever tested.
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=100, on_change=None):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.value = float(min(max(initial, self.min_limit), self.max_limit))
+        self.on_change = on_change
+        self.in_flight = 0
+
+        # Counters
+        self.samples = 0
+        self.drops = 0
+
+    @property
+    def limit(self):
+        return int(self.value)
+
+    @contextmanager
+    def measure(self):
+        self.in_flight += 1
+        in_flight = self.in_flight
+        sample = SimpleNamespace(dropped=False)
+        cancelled = False
+        start = time.monotonic()
+        try:
+            yield sample
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception:
+            sample.dropped = True
+            raise
+        finally:
+            self.in_flight -= 1
+            if not cancelled:
+                self.sample(time.monotonic() - start, in_flight, sample.dropped)
+
+    def sample(self, rtt, in_flight, dropped):
+        self.samples += 1
+        self.drops += dropped
+        before = self.limit
+        self.value = min(max(self._update(rtt, in_flight, dropped), self.min_limit), self.max_limit)
+        if self.limit != before and self.on_change is not None:
+            self.on_change(self.limit)
+
+    def _update(self, rtt, in_flight, dropped):
+        raise NotImplementedError
+
+
+class AIMDLimit(AdaptiveLimit):
+    """Additive increase, multiplicative decrease.
+
+    A drop, or a call slower than ``timeout`` seconds, multiplies the limit
+    by ``backoff``. Otherwise the limit grows by one per limit's worth of
+    samples, i.e. by one per round of calls, like TCP congestion avoidance.
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=100, backoff=0.9, timeout=5.0, on_change=None):
+        super().__init__(initial, min_limit, max_limit, on_change)
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def _update(self, rtt, in_flight, dropped):
+        if dropped or rtt > self.timeout:
+            return self.value * self.backoff
+        if in_flight * 2 >= self.value:
+            return self.value + 1 / self.value
+        return self.value
+
+
+class GradientLimit(AdaptiveLimit):
+    """Scales the limit by the ratio of long-term to current latency.
+
+    Follows Netflix concurrency-limits' Gradient2: the long-term latency is
+    an exponential average over ``window`` samples, and the gradient
+    ``tolerance * long / rtt`` (clamped to [0.5, 1]) shrinks the limit once
+    calls get slower than ``tolerance`` times their usual latency. A
+    headroom of sqrt(limit) lets the limit probe upwards while latency
+    holds, and ``smoothing`` damps each step. A drop aims at half the
+    limit, without headroom. When latency falls well below the long-term
+    average (after a cold start, say), the average decays towards it so the
+    limit can recover.
+    """
+
+    def __init__(self, initial, min_limit=1, max_limit=100, tolerance=1.5, smoothing=0.2, window=600,
+                 on_change=None):
+        super().__init__(initial, min_limit, max_limit, on_change)
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.window = window
+        self.long_rtt = 0.0
+
+    def _update(self, rtt, in_flight, dropped):
+        # Plain average over the first samples, then an exponential one
+        weight = 1 / self.samples if self.samples <= 10 else 2 / (self.window + 1)
+        self.long_rtt += (rtt - self.long_rtt) * weight
+        if rtt > 0 and self.long_rtt / rtt > 2:
+            self.long_rtt *= 0.95
+
+        if dropped:
+            target = self.value * 0.5
+        elif in_flight * 2 < self.value:
+            return self.value
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / rtt)) if rtt > 0 else 1.0
+            target = self.value * gradient + math.sqrt(self.value)
+        return self.value * (1 - self.smoothing) + target * self.smoothing
+
+
+def make_limit(algorithm, initial, min_limit=1, max_limit=100, on_change=None, **kwargs):
+    if algorithm == "aimd":
+        return AIMDLimit(initial, min_limit, max_limit, on_change=on_change, **kwargs)
+    if algorithm == "gradient":
+        return GradientLimit(initial, min_limit, max_limit, on_change=on_change, **kwargs)
+    raise ValueError(f"Unknown limit algorithm '{algorithm}', expected one of {LIMIT_ALGORITHMS}")
@@ -0,0 +1,47 @@
+"""The dispatcher's per-message tracing, also run by benchmarks/bench_tracing.py.
+
+With tracing disabled (TRACING_ENABLED=0) no trace context is extracted,
+attached or injected, and the spans are the invalid no-op span.
+"""
+from contextlib import contextmanager
+
+from opentelemetry import context
+
+import tracing_setup
+from tracing_setup import TRACING_ENABLED, start_span
+
+
+def attach_context(headers):
+    """Make the trace context in message ``headers`` current; returns a token for ``detach_context``."""
+    if not TRACING_ENABLED:
+        return None
+    return context.attach(tracing_setup.propagator.extract(headers))
+
+
+def detach_context(token):
+    if token is not None:
+        context.detach(token)
+
+
+def trace_headers():
+    """Return a new dict of HTTP headers carrying the current trace context."""
+    headers = {}
+    if TRACING_ENABLED:
+        tracing_setup.propagator.inject(headers)
+    return headers
+
+
+@contextmanager
+def message_span(tracer, queue_name, payload_size):
+    with start_span(tracer, f"process_message_{queue_name}") as span:
+        span.set_attribute("messaging.system", "rabbitmq")
+        span.set_attribute("messaging.destination", queue_name)
+        span.set_attribute("messaging.message_payload_size_bytes", payload_size)
+        yield span
+
+
+@contextmanager
+def faas_span(tracer, priority):
+    with start_span(tracer, f"FaaS_calling_{priority}") as span:
+        span.set_attribute("faas.system", "knative")
+        yield span
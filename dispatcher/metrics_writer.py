@@ -0,0 +1,89 @@
+import asyncio
+import logging
+import time
+
+LATENCY_LOG_FORMATS = ("text", "csv")
+
+
+class LatencyLogWriter:
+    """Buffers latency samples in memory and appends them to disk in batches.
+
+    ``record()`` is O(1) and never touches the file. A background task
+    flushes the buffer every ``flush_interval`` seconds, or sooner once
+    ``flush_size`` samples are waiting, writing from a worker thread so the
+    event loop never blocks on disk. The buffer holds at most ``max_buffer``
+    samples; beyond that new samples are dropped and counted rather than
+    slowing message processing down.
+
+    ``text`` keeps the ``<date> <time> Latency in <queue>: <seconds> seconds``
+    lines the analysis notebooks parse; ``csv`` writes
+    ``timestamp,queue,latency`` with full timestamp precision.
+    """
+
+    def __init__(self, path, fmt="text", flush_size=1000, flush_interval=1.0, max_buffer=100000):
+        if fmt not in LATENCY_LOG_FORMATS:
+            raise ValueError(f"Unknown latency log format '{fmt}', expected one of {LATENCY_LOG_FORMATS}")
+        self.path = path
+        self.fmt = fmt
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.wakeup = asyncio.Event()
+
+        # Counters
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_seconds = 0.0
+
+    def record(self, queue_name, latency, ts=None):
+        if len(self.buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        self.buffer.append((time.time() if ts is None else ts, queue_name, latency))
+        if len(self.buffer) >= self.flush_size:
+            self.wakeup.set()
+
+    def format(self, samples):
+        if self.fmt == "csv":
+            return "".join(f"{ts:.6f},{queue},{latency:.6f}\n" for ts, queue, latency in samples)
+        return "".join(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))} Latency in {queue}: {latency:.6f} seconds\n"
+            for ts, queue, latency in samples
+        )
+
+    def _write(self, samples):
+        data = self.format(samples)
+        with open(self.path, "a") as f:
+            if self.fmt == "csv" and f.tell() == 0:
+                f.write("timestamp,queue,latency\n")
+            f.write(data)
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        samples, self.buffer = self.buffer, []
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, samples)
+        except OSError as e:
+            self.dropped += len(samples)
+            logging.error(f"Failed to write {len(samples)} latency samples to {self.path}: {e}")
+            return
+        self.flush_seconds += time.perf_counter() - start
+        self.flushes += 1
+        self.written += len(samples)
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                await self.flush()
+        finally:
+            # Shutting down: write whatever is still buffered
+            await self.flush()
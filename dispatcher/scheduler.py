@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+LEVELS = ("high", "low")  # highest priority first
+SCHEDULER_POLICIES = ("strict", "wfq", "deadline")
+
+
+def parse_level_values(spec, default):
+    """Parse ``"high=4,low=1"`` into ``{"high": 4.0, "low": 1.0}`` on top of ``default``."""
+    values = dict(default)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        level, _, value = item.partition("=")
+        values[level.strip()] = float(value)
+    return values
+
+
+class PriorityScheduler:
+    """Grants a global number of executor slots to waiting high/low requests.
+
+    Handlers ``await acquire(level)`` (or use ``slot(level)``) before calling
+    the executor; at most ``limit`` of them hold a slot at once. When a slot
+    frees up the waiter to wake is chosen by ``policy``:
+
+    - ``strict``: always the oldest high waiter first, low only when no high
+      is waiting.
+    - ``wfq``: stride scheduling over levels with ``weights``, so backlogged
+      levels get slots in proportion to their weight.
+    - ``deadline``: earliest deadline first, where a waiter's deadline is its
+      arrival time plus the level's ``targets`` entry. High wins while fresh,
+      but low work ages into priority instead of starving.
+    """
+
+    def __init__(self, limit, policy="strict", weights=None, targets=None):
+        if policy not in SCHEDULER_POLICIES:
+            raise ValueError(f"Unknown scheduler policy '{policy}', expected one of {SCHEDULER_POLICIES}")
+        self.limit = max(1, limit)
+        self.policy = policy
+        self.weights = {"high": 4.0, "low": 1.0} if weights is None else weights
+        self.targets = {"high": 0.1, "low": 2.0} if targets is None else targets
+        self.active = 0
+        self.waiters = {level: deque() for level in LEVELS}  # (enqueued_at, future)
+        self.passes = {level: 0.0 for level in LEVELS}
+        self.granted = {level: 0 for level in LEVELS}
+
+    def waiting(self, level):
+        return len(self.waiters[level])
+
+    async def acquire(self, level):
+        if self.active < self.limit and not any(self.waiters.values()):
+            self.active += 1
+            self.granted[level] += 1
+            return
+
+        if self.policy == "wfq" and not self.waiters[level]:
+            # A level that was idle rejoins at the current virtual time, not with banked credit
+            backlogged = [self.passes[lvl] for lvl in LEVELS if self.waiters[lvl]]
+            if backlogged:
+                self.passes[level] = max(self.passes[level], min(backlogged))
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (time.monotonic(), future)
+        self.waiters[level].append(entry)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                if entry in self.waiters[level]:
+                    self.waiters[level].remove(entry)
+            else:
+                self.release()  # granted just before being cancelled
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    def resize(self, limit):
+        """Change the number of slots; shrinking waits for held slots to be released."""
+        self.limit = max(1, limit)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, level):
+        await self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _choose(self):
+        ready = [level for level in LEVELS if self.waiters[level]]
+        if self.policy == "strict":
+            return ready[0]
+        if self.policy == "wfq":
+            return min(ready, key=lambda level: self.passes[level])
+        return min(ready, key=lambda level: self.waiters[level][0][0] + self.targets[level])
+
+    def _dispatch(self):
+        while self.active < self.limit and any(self.waiters.values()):
+            level = self._choose()
+            _, future = self.waiters[level].popleft()
+            if future.done():
+                continue  # cancelled, its task has not run its cleanup yet
+            if self.policy == "wfq":
+                self.passes[level] += 1 / self.weights[level]
+            self.active += 1
+            self.granted[level] += 1
+            future.set_result(None)
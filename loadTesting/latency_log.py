@@ -0,0 +1,294 @@
+"""Streaming parser and aggregator for the dispatchers' latency logs.
+
+Reads the ``<date> <time> Latency in <channel>.<level>: <seconds> seconds``
+lines the dispatchers write (the logging variant with ``,<ms>`` after the
+time and any other lines in between are fine too), the CSV variant
+``timestamp,queue,latency`` written with ``LATENCY_LOG_FORMAT=csv``, and
+``loadgen.py --format csv`` output, whose samples are named
+``loadgen.<level>``. A CSV file with any other header is rejected.
+
+Files are read in large chunks, optionally memory-mapped, and each chunk is
+turned into NumPy columns in one go: the regex pass yields the fields as
+bytes, latencies are converted as one array, and timestamps and queue names
+are dictionary-encoded and converted once per distinct value. Several files
+are parsed in parallel worker processes.
+
+    from latency_log import load
+    log = load(["3Site/latency_metrics_dispatcher_1.txt", "3Site/latency_metrics_dispatcher_2.txt"])
+    log.percentiles(by="level")          # {"high": {"count": ..., "p50": ...}, ...}
+    log.throughput(bucket=10, by="queue")
+    log.sliding(window=60, step=10, by="level")
+
+    python loadTesting/latency_log.py 3Site/*.txt --by level --bucket 10 --window 60
+"""
+import argparse
+import mmap
+import os
+import re
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+CHUNK_SIZE = 16 * 1024 * 1024
+GROUPINGS = ("queue", "channel", "level", "all")
+
+TEXT_LINE = re.compile(
+    rb"^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)(?:[,.](\d+))?\b.*?Latency in (\S+): ([\d.]+) seconds", re.M
+)
+CSV_LINE = re.compile(rb"^([\d.]+),([^,\s]+),([\d.]+)\r?$", re.M)
+LOADGEN_LINE = re.compile(rb"^([\d.]+),([^,\s]+),\d+,([\d.]+),[\d.]+\r?$", re.M)
+CSV_FORMATS = {
+    b"timestamp,queue,latency": "csv",
+    b"timestamp,level,status,latency,service_latency": "loadgen",
+}
+
+
+class LatencyLog:
+    """Columns of latency samples: ``ts`` (epoch seconds), ``latency`` (seconds)
+    and ``queue`` (codes into ``queues``), sorted by timestamp.
+
+    Text-format timestamps only have one-second resolution, so buckets and
+    windows shorter than a second are not meaningful for them.
+    """
+
+    def __init__(self, ts, latency, queue, queues):
+        order = np.argsort(ts, kind="stable")
+        self.ts = ts[order]
+        self.latency = latency[order]
+        self.queue = queue[order]
+        self.queues = list(queues)
+
+    def __len__(self):
+        return len(self.ts)
+
+    def groups(self, by="queue"):
+        """Map group name to an array of queue codes belonging to it."""
+        if by not in GROUPINGS:
+            raise ValueError(f"Unknown grouping '{by}', expected one of {GROUPINGS}")
+        groups = {}
+        for code, name in enumerate(self.queues):
+            channel, _, level = name.rpartition(".")
+            key = {"queue": name, "channel": channel or name, "level": level, "all": "all"}[by]
+            groups.setdefault(key, []).append(code)
+        return {key: np.array(codes) for key, codes in sorted(groups.items())}
+
+    def masks(self, by="queue"):
+        return {key: np.isin(self.queue, codes) for key, codes in self.groups(by).items()}
+
+    def percentiles(self, pcts=(50, 90, 99), by="queue"):
+        stats = {}
+        for key, mask in self.masks(by).items():
+            values = self.latency[mask]
+            if not len(values):
+                continue
+            row = {"count": len(values), "mean": float(values.mean()), "max": float(values.max())}
+            for pct, value in zip(pcts, np.percentile(values, pcts)):
+                row[f"p{pct:g}"] = float(value)
+            stats[key] = row
+        return stats
+
+    def throughput(self, bucket=1.0, by="queue"):
+        """Return (bucket start times, {group: samples per second in each bucket})."""
+        if not len(self):
+            return np.array([]), {}
+        start = np.floor(self.ts[0] / bucket) * bucket
+        index = ((self.ts - start) // bucket).astype(np.int64)
+        nbuckets = int(index[-1]) + 1
+        rates = {
+            key: np.bincount(index[mask], minlength=nbuckets) / bucket
+            for key, mask in self.masks(by).items()
+        }
+        return start + np.arange(nbuckets) * bucket, rates
+
+    def sliding(self, window=60.0, step=10.0, pct=99, by="queue"):
+        """Per group, rows of (window end, count, rate, mean, percentile) every ``step`` seconds."""
+        if not len(self):
+            return {}
+        ends = np.arange(self.ts[0] + window, self.ts[-1] + step, step)
+        stats = {}
+        for key, mask in self.masks(by).items():
+            ts, latency = self.ts[mask], self.latency[mask]
+            lo = np.searchsorted(ts, ends - window, side="left")
+            hi = np.searchsorted(ts, ends, side="left")
+            rows = np.full((len(ends), 5), np.nan)
+            rows[:, 0] = ends
+            rows[:, 1] = hi - lo
+            rows[:, 2] = (hi - lo) / window
+            for i, (a, b) in enumerate(zip(lo, hi)):
+                if b > a:
+                    rows[i, 3] = latency[a:b].mean()
+                    rows[i, 4] = np.percentile(latency[a:b], pct)
+            stats[key] = rows
+        return stats
+
+
+def _encode(values):
+    """Dictionary-encode ``values``: return (int codes, distinct values in code order).
+
+    Queue names and one-second timestamps repeat a lot, so a dict beats
+    sorting millions of byte strings with np.unique.
+    """
+    index = {}
+    codes = np.array([index.setdefault(v, len(index)) for v in values], dtype=np.int32)
+    return codes, list(index)
+
+
+def _to_epoch(stamps):
+    """Convert ``%Y-%m-%d %H:%M:%S`` bytes (local time) to epoch seconds."""
+    return np.array([time.mktime(time.strptime(s.decode(), "%Y-%m-%d %H:%M:%S")) for s in stamps])
+
+
+def parse_chunk(data, fmt="text"):
+    """Parse one buffer of whole lines into (ts, latency, queue codes, queue names).
+
+    ``fmt`` is ``"text"``, ``"csv"`` or ``"loadgen"`` (see ``detect_format``).
+    """
+    if fmt in ("csv", "loadgen"):
+        fields = (CSV_LINE if fmt == "csv" else LOADGEN_LINE).findall(data)
+        ts = np.array([f[0] for f in fields]).astype(np.float64)
+        codes, queues = _encode([f[1] for f in fields])
+        latency = np.array([f[2] for f in fields]).astype(np.float64)
+        if fmt == "loadgen":
+            queues = [b"loadgen." + level for level in queues]
+    else:
+        fields = TEXT_LINE.findall(data)
+        stamp_codes, stamps = _encode([f[0] for f in fields])
+        ts = _to_epoch(stamps)[stamp_codes] if stamps else np.array([])
+        fraction = np.array([f[1] for f in fields])
+        if fraction.any():
+            # Logging timestamps carry ",<ms>"; pad to nanoseconds so "5" reads as 0.5
+            ts = ts + np.char.ljust(fraction, 9, b"0").astype(np.float64) / 1e9
+        codes, queues = _encode([f[2] for f in fields])
+        latency = np.array([f[3] for f in fields]).astype(np.float64)
+    return ts, latency, codes, [q.decode() for q in queues]
+
+
+def iter_chunks(path, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """Yield buffers of whole lines from ``path``."""
+    with open(path, "rb") as f:
+        if use_mmap:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = 0
+                while pos < len(mm):
+                    end = mm.find(b"\n", min(pos + chunk_size, len(mm)))
+                    end = len(mm) if end < 0 else end + 1
+                    yield mm[pos:end]
+                    pos = end
+            return
+        rest = b""
+        while block := f.read(chunk_size):
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                rest = block
+                continue
+            rest = block[cut:]
+            yield block[:cut]
+        if rest:
+            yield rest
+
+
+def merge(parts):
+    """Merge (ts, latency, codes, names) parts into one LatencyLog with shared queue codes."""
+    queues = sorted({name for part in parts for name in part[3]})
+    index = {name: code for code, name in enumerate(queues)}
+    ts, latency, codes = [], [], []
+    for part_ts, part_latency, part_codes, part_names in parts:
+        remap = np.array([index[name] for name in part_names], dtype=np.int32)
+        ts.append(part_ts)
+        latency.append(part_latency)
+        codes.append(remap[part_codes] if len(part_codes) else part_codes)
+    if not parts:
+        return LatencyLog(np.array([]), np.array([]), np.array([], dtype=np.int32), [])
+    return LatencyLog(np.concatenate(ts), np.concatenate(latency), np.concatenate(codes), queues)
+
+
+def detect_format(path):
+    """Return ``"text"``, ``"csv"`` or ``"loadgen"`` from the first line of ``path``.
+
+    Raises ValueError for a CSV header (a first line starting with
+    ``timestamp,``) that matches none of the known ones.
+    """
+    with open(path, "rb") as f:
+        header = f.readline().strip()
+    if header in CSV_FORMATS:
+        return CSV_FORMATS[header]
+    if header.startswith(b"timestamp,"):
+        raise ValueError(f"{path}: unrecognised CSV header {header.decode(errors='replace')!r}")
+    return "text"
+
+
+def parse_file(path, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """Parse one file, text or CSV (detected from the header), into a merged part."""
+    fmt = detect_format(path)
+    log = merge([parse_chunk(chunk, fmt) for chunk in iter_chunks(path, use_mmap, chunk_size)])
+    if not len(log) and os.path.getsize(path):
+        print(f"Warning: no latency samples found in {path}", file=sys.stderr)
+    return log.ts, log.latency, log.queue, log.queues
+
+
+def _parse_file_args(args):
+    return parse_file(*args)
+
+
+def load(paths, processes=None, use_mmap=False, chunk_size=CHUNK_SIZE):
+    """Parse ``paths`` (in parallel worker processes when there are several) into one LatencyLog."""
+    paths = [paths] if isinstance(paths, (str, os.PathLike)) else list(paths)
+    jobs = [(path, use_mmap, chunk_size) for path in paths]
+    processes = min(len(paths), processes or os.cpu_count() or 1)
+    if processes <= 1:
+        return merge([_parse_file_args(job) for job in jobs])
+    with Pool(processes) as pool:
+        return merge(pool.map(_parse_file_args, jobs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--by", choices=GROUPINGS, default="queue")
+    parser.add_argument("--percentiles", default="50,90,99")
+    parser.add_argument("--bucket", type=float, help="print throughput in buckets of this many seconds")
+    parser.add_argument("--window", type=float, help="print sliding-window stats over this many seconds")
+    parser.add_argument("--step", type=float, default=10.0, help="sliding window step in seconds")
+    parser.add_argument("--processes", type=int, help="worker processes, defaults to one per file up to the CPUs")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the files instead of reading them")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    log = load(args.paths, args.processes, args.mmap)
+    print(f"Parsed {len(log)} samples from {len(args.paths)} file(s) in {time.perf_counter() - start:.2f}s")
+
+    pcts = [float(p) for p in args.percentiles.split(",")]
+    stats = log.percentiles(pcts, by=args.by)
+    columns = ["count", "mean", *(f"p{p:g}" for p in pcts), "max"]
+    print(f"{args.by:>16} " + " ".join(f"{c:>10}" for c in columns))
+    for key, row in stats.items():
+        print(f"{key:>16} {row['count']:>10} " + " ".join(f"{row[c] * 1000:>8.1f}ms" for c in columns[1:]))
+
+    if args.bucket:
+        starts, rates = log.throughput(args.bucket, by=args.by)
+        print(f"\nThroughput (samples/s) per {args.bucket:g}s bucket")
+        print(f"{'bucket start':>20} " + " ".join(f"{key:>16}" for key in rates))
+        for i, bucket_start in enumerate(starts):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(bucket_start))
+            print(f"{stamp:>20} " + " ".join(f"{rates[key][i]:>16.2f}" for key in rates))
+
+    if args.window:
+        pct = pcts[-1]
+        print(f"\nSliding {args.window:g}s window every {args.step:g}s (rate/s, mean, p{pct:g})")
+        for key, rows in log.sliding(args.window, args.step, pct, by=args.by).items():
+            print(f"{key}:")
+            for end, count, rate, mean, tail in rows:
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end))
+                if count:
+                    print(f"  {stamp} n={int(count):>7} {rate:>8.2f}/s {mean * 1000:>8.1f}ms {tail * 1000:>8.1f}ms")
+                else:
+                    print(f"  {stamp} n=      0")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Open-loop load generator for the trigger and controller endpoints.
+
+Requests are sent on a precomputed schedule (``poisson``, ``constant`` or
+``step`` arrivals), independently of how fast earlier requests complete, so
+a slow system cannot slow the offered load down. Each request is high or low
+priority with probability ``--high-ratio``. At most ``--concurrency``
+requests are outstanding; a request that has to wait for a free connection
+still has its latency measured from its scheduled send time, which corrects
+for coordinated omission. The latency from the actual send is recorded too.
+
+Results are written in the dispatcher's latency log format
+(``<date> <time> Latency in <name>.<level>: <seconds> seconds``), which the
+analysis notebooks parse, or as CSV with ``--format csv``.
+
+    # Against the cluster's trigger
+    python loadTesting/loadgen.py --url http://192.168.17.121:30080/ --rate 50 --duration 60
+
+    # Step from 20 to 100 req/s after 30 s, against the controller directly
+    python loadTesting/loadgen.py --target controller --url http://controller:8000 \\
+        --arrival step --steps 20:30,100:30
+
+    # Fully local, against an in-process stub
+    python loadTesting/loadgen.py --stub --rate 200 --duration 10
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+ARRIVALS = ("poisson", "constant", "step")
+LEVELS = ("high", "low")
+
+
+def parse_steps(spec):
+    """Parse ``"RATE:SECONDS,RATE:SECONDS,..."`` into a list of (rate, seconds)."""
+    steps = []
+    for part in spec.split(","):
+        rate, _, seconds = part.partition(":")
+        if not seconds:
+            raise ValueError(f"Invalid step '{part}', expected RATE:SECONDS")
+        steps.append((float(rate), float(seconds)))
+    return steps
+
+
+def schedule(arrival, rate, duration, steps, rng):
+    """Yield send offsets in seconds from the start of the run."""
+    if arrival == "step":
+        phases = steps
+    else:
+        phases = [(rate, duration)]
+
+    start = 0.0
+    for phase_rate, phase_duration in phases:
+        end = start + phase_duration
+        t = start
+        while phase_rate > 0:
+            if arrival == "constant":
+                t += 1 / phase_rate
+            else:
+                # Step phases use Poisson arrivals at the phase's rate
+                t += rng.expovariate(phase_rate)
+            if t >= end:
+                break
+            yield t
+        start = end
+
+
+def request_url(target, url, level):
+    if target == "controller":
+        return f"{url.rstrip('/')}/{level}"
+    return f"{url}{'&' if '?' in url else '?'}level={level}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def start_stub(port, service_time, seed):
+    """Stand-in for the trigger/controller: answers after an exponential delay."""
+    rng = random.Random(seed)
+
+    async def handle(request):
+        await asyncio.sleep(rng.expovariate(1 / service_time) if service_time > 0 else 0)
+        return web.Response(text=f"Stub received {request.path_qs}\n")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    steps = parse_steps(args.steps) if args.arrival == "step" else []
+    offsets = list(schedule(args.arrival, args.rate, args.duration, steps, rng))
+    results = []  # (scheduled wall time, level, status, latency, service latency)
+    slots = asyncio.Semaphore(args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=timeout) as session:
+        async def send(level, scheduled, scheduled_wall):
+            async with slots:
+                sent = time.perf_counter()
+                try:
+                    async with session.get(request_url(args.target, args.url, level)) as resp:
+                        await resp.read()
+                        status = resp.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = 0
+                done = time.perf_counter()
+            results.append((scheduled_wall, level, status, done - scheduled, done - sent))
+
+        start = time.perf_counter()
+        start_wall = time.time()
+        tasks = []
+        for offset in offsets:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            level = "high" if rng.random() < args.high_ratio else "low"
+            tasks.append(asyncio.create_task(send(level, start + offset, start_wall + offset)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return sorted(results), elapsed
+
+
+def write_results(results, path, fmt, name):
+    with open(path, "w") as f:
+        if fmt == "csv":
+            f.write("timestamp,level,status,latency,service_latency\n")
+            for ts, level, status, latency, service in results:
+                f.write(f"{ts:.6f},{level},{status},{latency:.6f},{service:.6f}\n")
+        else:
+            for ts, level, status, latency, _ in results:
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+                f.write(f"{stamp} Latency in {name}.{level}: {latency:.6f} seconds\n")
+
+
+def print_summary(results, elapsed):
+    print(f"{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.1f} req/s)")
+    print(f"{'level':>6} {'count':>7} {'errors':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9} {'p99 uncorr.':>12}")
+    for level in LEVELS:
+        rows = [r for r in results if r[1] == level]
+        latencies = sorted(r[3] for r in rows)
+        service = sorted(r[4] for r in rows)
+        errors = sum(1 for r in rows if not 200 <= r[2] < 300)
+        print(f"{level:>6} {len(rows):>7} {errors:>7} "
+              f"{percentile(latencies, 50) * 1000:>7.1f}ms {percentile(latencies, 90) * 1000:>7.1f}ms "
+              f"{percentile(latencies, 99) * 1000:>7.1f}ms {percentile(latencies, 100) * 1000:>7.1f}ms "
+              f"{percentile(service, 99) * 1000:>10.1f}ms")
+
+
+async def main(args):
+    stub = None
+    if args.stub:
+        stub = await start_stub(args.stub_port, args.stub_service_time, args.seed + 1)
+        args.url = f"http://127.0.0.1:{args.stub_port}/"
+    try:
+        results, elapsed = await run(args)
+    finally:
+        if stub is not None:
+            await stub.cleanup()
+
+    print_summary(results, elapsed)
+    if args.output:
+        write_results(results, args.output, args.format, args.name or args.target)
+        print(f"Wrote {len(results)} samples to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://192.168.17.121:30080/")
+    parser.add_argument("--target", choices=("trigger", "controller"), default="trigger",
+                        help="trigger takes ?level=, the controller /<level>")
+    parser.add_argument("--arrival", choices=ARRIVALS, default="poisson")
+    parser.add_argument("--rate", type=float, default=50.0, help="requests/sec for poisson and constant")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds, for poisson and constant")
+    parser.add_argument("--steps", default="20:30,100:30", help="RATE:SECONDS,... for step arrivals")
+    parser.add_argument("--high-ratio", type=float, default=0.5, help="fraction of high priority requests")
+    parser.add_argument("--concurrency", type=int, default=256, help="max outstanding requests")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="file to write per-request latencies to")
+    parser.add_argument("--format", choices=("text", "csv"), default="text")
+    parser.add_argument("--name", help="name in text output lines, defaults to --target")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stub", action="store_true", help="run against an in-process stub server")
+    parser.add_argument("--stub-port", type=int, default=18090)
+    parser.add_argument("--stub-service-time", type=float, default=0.02, help="mean stub delay in seconds")
+    args = parser.parse_args()
+    if not 0 <= args.high_ratio <= 1:
+        sys.exit("--high-ratio must be between 0 and 1")
+    asyncio.run(main(args))
@@ -0,0 +1,202 @@
+"""OpenTelemetry setup shared by the trigger, controller and dispatcher.
+
+Each service calls ``setup_tracing(<service name>)`` once and uses the
+returned tracer, and uses the module-level ``propagator`` instead of
+building a TraceContextTextMapPropagator per message. The Dockerfiles copy
+this file next to the service code.
+
+Configured from the environment:
+
+- TRACING_ENABLED=0 installs the no-op tracer provider, so nothing is
+  recorded or exported. Per-message code should also skip context
+  propagation when it is off: check ``TRACING_ENABLED`` and open spans
+  with ``start_span``, which then leaves the current context alone.
+- TRACE_SAMPLE_RATIO samples that fraction of new traces by trace id;
+  requests arriving with a parent follow the parent's decision, so a
+  trace is kept or dropped as a whole across services.
+- TRACE_TAIL_LATENCY_MS > 0 additionally records unsampled traces and
+  exports them after all if, in this service, a span took at least that
+  long or failed (error status, an exception event or an HTTP status of
+  500 or more). This keeps the slow and failed requests while still
+  dropping most traces. Every trace is still built in memory, so it saves
+  export volume but no CPU: per message it costs as much as
+  TRACE_SAMPLE_RATIO=1.0 (see benchmarks/bench_tracing.py).
+- TRACE_MAX_QUEUE_SIZE, TRACE_MAX_EXPORT_BATCH_SIZE,
+  TRACE_SCHEDULE_DELAY_MS and TRACE_EXPORT_TIMEOUT_MS tune the batch
+  exporter; JAEGER_ENDPOINT is the Jaeger collector.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    Decision, ParentBased, Sampler, SamplingResult, TraceIdRatioBased,
+)
+from opentelemetry.trace import SpanContext, StatusCode, TraceFlags
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "1.0"))
+TRACE_TAIL_LATENCY_MS = float(os.getenv("TRACE_TAIL_LATENCY_MS", "0"))  # 0 disables tail retention
+TRACE_TAIL_MAX_TRACES = int(os.getenv("TRACE_TAIL_MAX_TRACES", "10000"))  # unsampled traces held at once
+TRACE_MAX_QUEUE_SIZE = int(os.getenv("TRACE_MAX_QUEUE_SIZE", "2048"))
+TRACE_MAX_EXPORT_BATCH_SIZE = int(os.getenv("TRACE_MAX_EXPORT_BATCH_SIZE", "512"))
+TRACE_SCHEDULE_DELAY_MS = float(os.getenv("TRACE_SCHEDULE_DELAY_MS", "5000"))
+TRACE_EXPORT_TIMEOUT_MS = float(os.getenv("TRACE_EXPORT_TIMEOUT_MS", "30000"))
+JAEGER_ENDPOINT = os.getenv("JAEGER_ENDPOINT", "http://jaeger.observability.svc.cluster.local:14268/api/traces")
+
+# Stateless, so one instance serves every message
+propagator = TraceContextTextMapPropagator()
+
+
+def start_span(tracer, name):
+    """``tracer.start_as_current_span(name)``, or the invalid no-op span with the
+    current context left untouched when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return nullcontext(trace.INVALID_SPAN)
+    return tracer.start_as_current_span(name)
+
+
+class RecordUnsampled(Sampler):
+    """Wraps a sampler, turning its DROP decisions into RECORD_ONLY.
+
+    Recorded-but-unsampled spans are not exported by BatchSpanProcessor;
+    ``TailRetainingProcessor`` decides whether to export them after all.
+    """
+
+    def __init__(self, delegate):
+        self.delegate = delegate
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None):
+        result = self.delegate.should_sample(parent_context, trace_id, name, kind, attributes, links, trace_state)
+        if result.decision is Decision.DROP:
+            return SamplingResult(Decision.RECORD_ONLY, result.attributes, result.trace_state)
+        return result
+
+    def get_description(self):
+        return f"RecordUnsampled{{{self.delegate.get_description()}}}"
+
+
+class TailRetainingProcessor(SpanProcessor):
+    """Exports sampled spans, and unsampled traces that turned out slow or failed.
+
+    Spans of unsampled traces are held per trace until the trace's local
+    root span (no parent, or a remote one) ends. The trace is then exported
+    if any of its spans lasted at least ``latency_threshold`` seconds or
+    failed, and discarded otherwise. At most ``max_traces`` unsampled traces
+    are held; the oldest are discarded beyond that.
+    """
+
+    def __init__(self, delegate, latency_threshold, max_traces=10000):
+        self.delegate = delegate
+        self.latency_threshold_ns = int(latency_threshold * 1e9)
+        self.max_traces = max_traces
+        self.pending = OrderedDict()  # trace id -> [keep, spans]
+        self.lock = threading.Lock()
+
+        # Counters
+        self.retained = 0
+        self.discarded = 0
+
+    def on_start(self, span, parent_context=None):
+        self.delegate.on_start(span, parent_context)
+
+    def interesting(self, span):
+        if span.end_time - span.start_time >= self.latency_threshold_ns:
+            return True
+        if span.status.status_code is StatusCode.ERROR:
+            return True
+        if any(event.name == "exception" for event in span.events):
+            return True
+        status = span.attributes.get("http.status_code")
+        return isinstance(status, int) and status >= 500
+
+    def on_end(self, span):
+        if span.context.trace_flags.sampled:
+            self.delegate.on_end(span)
+            return
+
+        trace_id = span.context.trace_id
+        local_root = span.parent is None or span.parent.is_remote
+        with self.lock:
+            entry = self.pending.get(trace_id)
+            if entry is None:
+                entry = self.pending[trace_id] = [False, []]
+                if len(self.pending) > self.max_traces:
+                    self.pending.popitem(last=False)
+                    self.discarded += 1
+            entry[0] = entry[0] or self.interesting(span)
+            entry[1].append(span)
+            if not local_root:
+                return
+            keep, spans = self.pending.pop(trace_id)
+            if keep:
+                self.retained += 1
+            else:
+                self.discarded += 1
+        if keep:
+            for held in spans:
+                self.delegate.on_end(_SampledView(held))
+
+    def shutdown(self):
+        self.delegate.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self.delegate.force_flush(timeout_millis)
+
+
+class _SampledView:
+    """A finished span as seen by exporters, with the sampled flag set.
+
+    Everything but the context is read from the wrapped span, so the batch
+    processor exports it and exporters see the original data.
+    """
+
+    def __init__(self, span):
+        self._span = span
+        ctx = span.context
+        self.context = SpanContext(
+            ctx.trace_id, ctx.span_id, ctx.is_remote, TraceFlags(TraceFlags.SAMPLED), ctx.trace_state
+        )
+
+    def get_span_context(self):
+        return self.context
+
+    def __getattr__(self, name):
+        return getattr(self._span, name)
+
+
+def setup_tracing(service_name, exporter=None):
+    """Install the tracer provider for ``service_name`` and return its tracer.
+
+    ``exporter`` defaults to the Jaeger Thrift exporter for JAEGER_ENDPOINT.
+    """
+    if not TRACING_ENABLED:
+        trace.set_tracer_provider(trace.NoOpTracerProvider())
+        return trace.get_tracer(service_name)
+
+    sampler = ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO))
+    if TRACE_TAIL_LATENCY_MS > 0:
+        sampler = RecordUnsampled(sampler)
+    provider = TracerProvider(resource=Resource.create({SERVICE_NAME: service_name}), sampler=sampler)
+
+    if exporter is None:
+        from opentelemetry.exporter.jaeger.thrift import JaegerExporter
+        exporter = JaegerExporter(collector_endpoint=JAEGER_ENDPOINT)
+    processor = BatchSpanProcessor(
+        exporter,
+        max_queue_size=TRACE_MAX_QUEUE_SIZE,
+        max_export_batch_size=TRACE_MAX_EXPORT_BATCH_SIZE,
+        schedule_delay_millis=TRACE_SCHEDULE_DELAY_MS,
+        export_timeout_millis=TRACE_EXPORT_TIMEOUT_MS,
+    )
+    if TRACE_TAIL_LATENCY_MS > 0:
+        processor = TailRetainingProcessor(processor, TRACE_TAIL_LATENCY_MS / 1000, TRACE_TAIL_MAX_TRACES)
+    provider.add_span_processor(processor)
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer(service_name)
@@ -1,45 +1,48 @@
 # trigger.py
 
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import BoundedSemaphore
 from urllib.parse import urlparse, parse_qs
+import contextvars
 import requests
 import os
 
-from opentelemetry import trace
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.jaeger.thrift import JaegerExporter
 from opentelemetry.instrumentation.requests import RequestsInstrumentor
+from tracing_setup import TRACING_ENABLED, setup_tracing
 
 # Server config
 HOST = '0.0.0.0'
 PORT = 8080
-
-# Tracing setup
-resource = Resource(attributes={"service.name": "trigger"})
-trace_provider = TracerProvider(resource=resource)
-jaeger_exporter = JaegerExporter(
-    collector_endpoint="http://jaeger.observability.svc.cluster.local:14268/api/traces"
-)
-span_processor = BatchSpanProcessor(jaeger_exporter)
-trace_provider.add_span_processor(span_processor)
-trace.set_tracer_provider(trace_provider)
-tracer = trace.get_tracer("trigger")
-
-# Instrument requests
+# "sync" replies once the controller answered, "async" (fire-and-forget) replies
+# 202 as soon as the request is queued; ?mode= overrides per request
+TRIGGER_MODE = os.getenv("TRIGGER_MODE", "sync")
+MAX_IN_FLIGHT = int(os.getenv("TRIGGER_MAX_IN_FLIGHT", "256"))  # beyond this, reply 503
+POOL_SIZE = int(os.getenv("TRIGGER_POOL_SIZE", "64"))          # async forwarding threads
+
+# Tracing setup (sampling and exporter settings in tracing_setup)
+tracer = setup_tracing("trigger")
+
+# Instrument requests; one pooled session shared by all handler threads. In sync mode
+# every in-flight request may hold a connection, so the pool keeps that many alive
+# rather than opening and discarding extra ones in bursts
 session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(max_retries=3)
+adapter = requests.adapters.HTTPAdapter(max_retries=3, pool_connections=1, pool_maxsize=MAX_IN_FLIGHT)
 session.mount("http://", adapter)
-RequestsInstrumentor().instrument(session=session)
+if TRACING_ENABLED:
+    RequestsInstrumentor().instrument(session=session)
+
+in_flight = BoundedSemaphore(MAX_IN_FLIGHT)
+forward_pool = ThreadPoolExecutor(max_workers=POOL_SIZE)
 
 # Controller endpoint
 CONTROLLER_URL_BASE = os.getenv("CONTROLLER_URL_BASE", "http://controller-service.default.svc.cluster.local")
 
 def trigger_action(level):
+    """Forward one request to the controller; returns its response, or None if it failed."""
     if level not in ('low', 'high'):
         print(f"Unknown trigger level: {level}")
-        return
+        return None
 
     with tracer.start_as_current_span("trigger-request") as span:
         url = f"{CONTROLLER_URL_BASE}/{level}"
@@ -50,9 +53,17 @@ def trigger_action(level):
             response = session.get(url, timeout=2)
             span.set_attribute("http.status_code", response.status_code)
             print(f"Forwarded to controller: {response.status_code} - {response.text.strip()}")
+            return response
         except requests.RequestException as e:
             span.record_exception(e)
             print(f"Error forwarding to controller: {e}")
+            return None
+
+def trigger_in_background(level):
+    try:
+        trigger_action(level)
+    finally:
+        in_flight.release()
 
 class TriggerHandler(BaseHTTPRequestHandler):
     def do_GET(self):
@@ -64,20 +75,54 @@ class TriggerHandler(BaseHTTPRequestHandler):
             span.set_attribute("http.request.path", self.path)
             span.set_attribute("trigger.level", level if level else "none")
 
-            if level in ('low', 'high'):
-                trigger_action(level)
-                response = f"Trigger received for level: {level}\n"
-            else:
-                response = "Please provide 'level' as either 'low' or 'high'\n"
+            mode = query_params.get('mode', [TRIGGER_MODE])[0]
+            span.set_attribute("trigger.mode", mode)
 
-            self.send_response(200)
+            retry_after = None
+            if level not in ('low', 'high'):
+                response = "Please provide 'level' as either 'low' or 'high'\n"
+                status = 200
+            elif not in_flight.acquire(blocking=False):
+                response = "Too many requests in flight, retry later\n"
+                status = 503
+                retry_after = '1'
+            elif mode == "async":
+                # Carry the current trace context over to the forwarding thread
+                forward_pool.submit(contextvars.copy_context().run, trigger_in_background, level)
+                response = f"Trigger queued for level: {level}\n"
+                status = 202
+            else:
+                try:
+                    forwarded = trigger_action(level)
+                finally:
+                    in_flight.release()
+                # Pass the controller's answer through, so its admission 429s and
+                # Retry-After reach the client
+                if forwarded is None:
+                    response = "Failed to reach the controller\n"
+                    status = 502
+                elif 200 <= forwarded.status_code < 300:
+                    response = f"Trigger received for level: {level}\n"
+                    status = forwarded.status_code
+                else:
+                    response = forwarded.text
+                    status = forwarded.status_code
+                    retry_after = forwarded.headers.get('Retry-After')
+
+            self.send_response(status)
+            if retry_after is not None:
+                self.send_header('Retry-After', retry_after)
             self.send_header('Content-type', 'text/plain')
             self.end_headers()
             self.wfile.write(response.encode())
 
+class TriggerServer(ThreadingHTTPServer):
+    # The socketserver default backlog of 5 drops connections under bursts
+    request_queue_size = 1024
+
 def run_server():
     server_address = (HOST, PORT)
-    httpd = HTTPServer(server_address, TriggerHandler)
+    httpd = TriggerServer(server_address, TriggerHandler)
     print(f'Serving trigger on http://{HOST}:{PORT}')
     httpd.serve_forever()
 